@@ -0,0 +1,57 @@
+import os, sys, time
+import faiss
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from index_factory import IndexBuilder, apply_search_params
+
+DIM = 128
+NUM_VECTORS = 100_000
+NUM_QUERIES = 500
+TOP_K = 15
+SWEEPS = {
+    "flat":  [{}],
+    "hnsw":  [{"efSearch": ef} for ef in (16, 32, 64, 128)],
+    "ivfpq": [{"nprobe": p, "k_factor": 8} for p in (4, 8, 16, 32, 64)] + [{"nprobe": 16, "k_factor": f} for f in (1, 4, 16)],
+}
+
+def synthetic_vectors(n, dim, seed=0, clusters=200):
+    """Clustered unit vectors, closer to real embeddings than uniform noise."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype("float32")
+    x = centers[rng.integers(0, clusters, n)] + 0.6 * rng.standard_normal((n, dim)).astype("float32")
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+def recall_at_k(found, truth):
+    return float(np.mean([len(set(f) & set(t)) / len(t) for f, t in zip(found, truth)]))
+
+def main():
+    faiss.omp_set_num_threads(1)  # single-thread latency, as on an edge CPU
+    data = synthetic_vectors(NUM_VECTORS + NUM_QUERIES, DIM)
+    base, queries = data[:NUM_VECTORS], data[NUM_VECTORS:]
+
+    print(f"\nANN index benchmark: {NUM_VECTORS} x {DIM}-d vectors, {NUM_QUERIES} queries, top-{TOP_K}")
+    print("-" * 72)
+    print(f"{'Index':<8} {'Params':<22} {'Build (s)':>9} {'Size (MB)':>10} {'ms/query':>9} {f'Recall@{TOP_K}':>10}")
+
+    truth = None
+    for kind, sweep in SWEEPS.items():
+        t0 = time.perf_counter()
+        builder = IndexBuilder(DIM, kind)
+        builder.add(base)
+        index = builder.finish()
+        build_s = time.perf_counter() - t0
+        size_mb = faiss.serialize_index(index).nbytes / 1e6
+
+        for params in sweep:
+            apply_search_params(index, params)
+            t0 = time.perf_counter()
+            _, ids = index.search(queries, TOP_K)
+            ms = (time.perf_counter() - t0) * 1000 / NUM_QUERIES
+            if truth is None:
+                truth = ids
+            label = ",".join(f"{k}={v}" for k, v in params.items()) or "-"
+            print(f"{kind:<8} {label:<22} {build_s:>9.2f} {size_mb:>10.1f} {ms:>9.3f} {recall_at_k(ids, truth):>10.3f}")
+
+if __name__ == "__main__":
+    main()
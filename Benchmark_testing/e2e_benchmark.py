@@ -0,0 +1,240 @@
+"""
+End-to-end performance benchmark. Builds a synthetic PDF corpus, serves stubbed
+embed/generate endpoints on localhost, and measures ingest, embedding, FAISS,
+engine cold start and query latency. Results are printed and written as JSON
+(default: results/e2e_<commit>.json) so runs can be diffed across commits.
+
+    python e2e_benchmark.py [out.json]
+
+Set EDGERAG_BENCH_ONNX to a local ONNX embedding model directory to also
+measure local embedding throughput by batch size and sequence length.
+"""
+import json, os, platform, random, subprocess, sys, tempfile, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import faiss
+import fitz
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+from ann_index_benchmark import synthetic_vectors
+from collection import Collection
+from engine_remote import RAGEngine
+from http_client import RemoteClient
+from index_factory import IndexBuilder
+from ingest_remote import EMBED_DIM, Ingestor
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+ONNX_DIR = os.environ.get("EDGERAG_BENCH_ONNX")
+
+NUM_PAGES = 50
+WORDS_PER_PAGE = 400
+EMBED_CHUNKS = 1024
+EMBED_BATCH_SIZES = [8, 32, 128]
+LOCAL_BATCH_SIZES = [1, 8, 32]
+LOCAL_SEQ_WORDS = [16, 64, 256]
+FAISS_KINDS = ["flat", "hnsw", "ivfpq"]
+FAISS_SIZES = [10_000, 100_000]
+FAISS_QUERIES = 200
+TOP_K = 15
+NUM_QUERIES = 50
+ANSWER_WORDS = 40
+
+# Simulated service costs of the stub endpoints
+EMBED_CALL_S = 0.01
+EMBED_ITEM_S = 0.0002
+GEN_FIRST_TOKEN_S = 0.05
+GEN_TOKEN_S = 0.005
+
+WORDS = "the model results figure table method data attention layer training loss we show that in of and".split()
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Stand-in for both hosted endpoints: /embed returns random unit vectors, /generate streams words."""
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if self.path.endswith("/embed"):
+            time.sleep(EMBED_CALL_S + EMBED_ITEM_S * len(body["chunks"]))
+            vecs = np.random.rand(len(body["chunks"]), EMBED_DIM).astype("float32")
+            vecs /= np.linalg.norm(vecs, axis=1, keepdims=True)
+            out = json.dumps({"embeddings": vecs.tolist()}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(out)))
+            self.end_headers()
+            self.wfile.write(out)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        time.sleep(GEN_FIRST_TOKEN_S)
+        for i in range(ANSWER_WORDS):
+            word = f"{random.choice(WORDS)} ".encode()
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(word), word))
+            self.wfile.flush()
+            time.sleep(GEN_TOKEN_S)
+        self.wfile.write(b"0\r\n\r\n")
+
+    def log_message(self, *args):
+        pass
+
+def start_stub():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    return server, base + "/embed", base + "/generate"
+
+def synthetic_text(n_words, rng):
+    return " ".join(rng.choice(WORDS) for _ in range(n_words))
+
+def synthetic_pdf(path, pages, seed=0):
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for _ in range(pages):
+        page = doc.new_page()
+        page.insert_textbox(page.rect + (36, 36, -36, -36), synthetic_text(WORDS_PER_PAGE, rng), fontsize=9)
+    doc.save(path)
+    doc.close()
+
+def percentiles(xs):
+    arr = np.array(xs) * 1000
+    return {"mean_ms": float(arr.mean()), "p50_ms": float(np.percentile(arr, 50)), "p95_ms": float(np.percentile(arr, 95))}
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def bench_ingest(workdir, pdf_path, client):
+    coll = Collection(os.path.join(workdir, "ingest"), EMBED_DIM)
+    t0 = time.perf_counter()
+    Ingestor(client=client, use_cache=False).ingest_into(coll, pdf_path)
+    elapsed = time.perf_counter() - t0
+    res = {"pages": NUM_PAGES, "chunks": len(coll), "seconds": elapsed,
+           "pages_per_s": NUM_PAGES / elapsed, "chunks_per_s": len(coll) / elapsed}
+    print(f"\nIngest: {NUM_PAGES} pages, {len(coll)} chunks in {elapsed:.2f}s "
+          f"({res['pages_per_s']:.1f} pages/s, {res['chunks_per_s']:.1f} chunks/s)")
+    return res
+
+def bench_embed_remote(embed_url):
+    rng = random.Random(1)
+    texts = [synthetic_text(80, rng) for _ in range(EMBED_CHUNKS)]
+    print(f"\nRemote embedding (stub): {EMBED_CHUNKS} chunks")
+    print(f"{'Batch':>6} {'Chunks/s':>10} {'p50 call (ms)':>14}")
+    rows = []
+    for bs in EMBED_BATCH_SIZES:
+        client = RemoteClient(embed_url=embed_url, batch_size=bs)
+        t0 = time.perf_counter()
+        client.embed(texts)
+        elapsed = time.perf_counter() - t0
+        rows.append({"batch_size": bs, "chunks_per_s": EMBED_CHUNKS / elapsed, **client.stats()["embed"]})
+        print(f"{bs:>6} {EMBED_CHUNKS / elapsed:>10.0f} {rows[-1]['p50_ms']:>14.1f}")
+    return rows
+
+def bench_embed_local():
+    if not ONNX_DIR:
+        print("\nLocal embedding: skipped (set EDGERAG_BENCH_ONNX)")
+        return []
+    sys.path.append(os.path.join(ROOT, "Local_run"))
+    from ingest import Ingestor as LocalIngestor
+    ing = LocalIngestor(ONNX_DIR, embed_dim=EMBED_DIM, use_cache=False)
+    rng = random.Random(2)
+
+    print(f"\nLocal ONNX embedding: {ONNX_DIR}")
+    print(f"{'Batch':>6} {'Words':>6} {'Chunks/s':>10}")
+    rows = []
+    for words in LOCAL_SEQ_WORDS:
+        texts = [synthetic_text(words, rng) for _ in range(max(LOCAL_BATCH_SIZES) * 4)]
+        for bs in LOCAL_BATCH_SIZES:
+            ing._encode(texts[:bs], token_budget=1 << 30, max_batch=bs)  # warm-up
+            t0 = time.perf_counter()
+            ing._encode(texts, token_budget=1 << 30, max_batch=bs)
+            elapsed = time.perf_counter() - t0
+            rows.append({"batch_size": bs, "seq_words": words, "chunks_per_s": len(texts) / elapsed})
+            print(f"{bs:>6} {words:>6} {len(texts) / elapsed:>10.0f}")
+    return rows
+
+def bench_faiss():
+    print(f"\nFAISS search: top-{TOP_K}, {FAISS_QUERIES} single queries")
+    print(f"{'Index':<8} {'Size':>8} {'Build (s)':>10} {'p50 (ms)':>9} {'p95 (ms)':>9}")
+    queries = synthetic_vectors(FAISS_QUERIES, EMBED_DIM, seed=9)
+    rows = []
+    for n in FAISS_SIZES:
+        base = synthetic_vectors(n, EMBED_DIM)
+        for kind in FAISS_KINDS:
+            t0 = time.perf_counter()
+            builder = IndexBuilder(EMBED_DIM, kind)
+            builder.add(base)
+            index = builder.finish()
+            build_s = time.perf_counter() - t0
+            lat = []
+            for q in queries:
+                t0 = time.perf_counter()
+                index.search(q[None], TOP_K)
+                lat.append(time.perf_counter() - t0)
+            rows.append({"kind": builder.kind, "size": n, "build_s": build_s, **percentiles(lat)})
+            print(f"{builder.kind:<8} {n:>8} {build_s:>10.2f} {rows[-1]['p50_ms']:>9.3f} {rows[-1]['p95_ms']:>9.3f}")
+    return rows
+
+def bench_query(workdir, client):
+    path = os.path.join(workdir, "ingest")
+    t0 = time.perf_counter()
+    engine = RAGEngine(store=Collection(path, EMBED_DIM), client=client, use_cache=False)
+    cold_s = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    engine.search("the attention layer results")
+    first_query_s = time.perf_counter() - t0
+
+    rng = random.Random(3)
+    search_lat, ttft, total = [], [], []
+    for _ in range(NUM_QUERIES):
+        q = synthetic_text(8, rng)
+        t0 = time.perf_counter()
+        _, hits = engine.search(q)
+        search_lat.append(time.perf_counter() - t0)
+        first = None
+        # Score threshold is meaningless on random stub vectors, so always generate
+        for _ in engine.stream_answer(q, hits or [{"id": 0, "text": "-"}]):
+            first = first or time.perf_counter()
+        ttft.append(first - t0)
+        total.append(time.perf_counter() - t0)
+
+    res = {"cold_start_s": cold_s, "first_query_s": first_query_s,
+           "search": percentiles(search_lat), "ttft": percentiles(ttft), "total": percentiles(total)}
+    print(f"\nEngine cold start {cold_s * 1000:.1f} ms, first query {first_query_s * 1000:.1f} ms")
+    print(f"{'Query ({} runs)'.format(NUM_QUERIES):<18} {'p50 (ms)':>9} {'p95 (ms)':>9}")
+    for name in ("search", "ttft", "total"):
+        print(f"{name:<18} {res[name]['p50_ms']:>9.1f} {res[name]['p95_ms']:>9.1f}")
+    return res
+
+def main():
+    faiss.omp_set_num_threads(1)  # single-thread latency, as on an edge CPU
+    server, embed_url, gen_url = start_stub()
+    client = RemoteClient(embed_url=embed_url, gen_url=gen_url)
+    results = {"commit": git_commit(), "timestamp": time.time(), "python": platform.python_version(),
+               "platform": platform.platform(), "cpus": os.cpu_count()}
+
+    with tempfile.TemporaryDirectory() as workdir:
+        pdf_path = os.path.join(workdir, "corpus.pdf")
+        synthetic_pdf(pdf_path, NUM_PAGES)
+        results["ingest"] = bench_ingest(workdir, pdf_path, client)
+        results["embed_remote"] = bench_embed_remote(embed_url)
+        results["embed_local"] = bench_embed_local()
+        results["faiss"] = bench_faiss()
+        results["query"] = bench_query(workdir, client)
+    server.shutdown()
+
+    out = sys.argv[1] if len(sys.argv) > 1 else os.path.join(RESULTS_DIR, f"e2e_{results['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {out}")
+
+if __name__ == "__main__":
+    main()
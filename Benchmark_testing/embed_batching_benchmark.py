@@ -0,0 +1,63 @@
+"""
+Fixed 512-token batches vs. length-bucketed embed_batch on synthetic chunks.
+
+Usage: python embed_batching_benchmark.py [onnx_model_dir]
+The model directory defaults to EDGERAG_BENCH_ONNX.
+"""
+import os, random, sys, time
+import numpy as np
+
+ONNX_DIR = sys.argv[1] if len(sys.argv) > 1 else os.environ.get("EDGERAG_BENCH_ONNX")
+NUM_CHUNKS = 256
+CHUNK_CHARS = (100, 500)   # local ingest produces <=500-character chunks
+WORDS = "the model results figure table method data attention layer training loss we show that in of and".split()
+
+def fixed_length_embed(ing, texts, batch_size=8):
+    """The previous embed_batch: fixed batches of 8, every row padded to 512 tokens."""
+    emb, all_vecs = ing.embedder, []
+    for i in range(0, len(texts), batch_size):
+        inputs, mask = emb.feed(emb.tokenize(texts[i:i + batch_size]), pad_to=512)
+        all_vecs.append(emb.pool(emb.run(inputs), mask, ing.embed_dim))
+    return np.vstack(all_vecs)
+
+def synthetic_chunks(n, seed=0):
+    rng = random.Random(seed)
+    out = []
+    for _ in range(n):
+        target = rng.randint(*CHUNK_CHARS)
+        words = []
+        while sum(len(w) + 1 for w in words) < target:
+            words.append(rng.choice(WORDS))
+        out.append(" ".join(words)[:target])
+    return out
+
+def timed(fn, repeats=3):
+    best = float("inf")
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+def main():
+    if not ONNX_DIR:
+        sys.exit("Set EDGERAG_BENCH_ONNX or pass the ONNX embedding model directory as the first argument")
+    sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Local_run"))
+    from ingest import Ingestor
+    ing = Ingestor(ONNX_DIR, use_cache=False)
+    texts = synthetic_chunks(NUM_CHUNKS)
+    lengths = [len(e.ids) for e in ing.embedder.tokenize(texts)]
+
+    base_s, base = timed(lambda: fixed_length_embed(ing, texts))
+    print(f"\nEmbedding {NUM_CHUNKS} chunks (mean {np.mean(lengths):.0f} tokens, max {max(lengths)})")
+    print("-" * 60)
+    print(f"{'Path':<28} {'Time (s)':>9} {'Chunks/s':>10} {'Speedup':>8}")
+    print(f"{'fixed 512 x 8':<28} {base_s:>9.2f} {NUM_CHUNKS / base_s:>10.1f} {1.0:>8.2f}")
+
+    for budget in (2048, 4096, 8192, 16384):
+        s, vecs = timed(lambda: ing.embed_batch(texts, token_budget=budget))
+        drift = float(np.abs(vecs - base).max())
+        print(f"{f'bucketed budget={budget}':<28} {s:>9.2f} {NUM_CHUNKS / s:>10.1f} {base_s / s:>8.2f}  (max |diff| {drift:.1e})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import os, sys, time
+import faiss
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ann_index_benchmark import recall_at_k
+from index_factory import IndexBuilder
+from matryoshka import coarse, rerank
+
+FULL_DIM = 384
+NUM_VECTORS = 100_000
+NUM_QUERIES = 200
+TOP_K = 15
+COARSE_DIMS = [32, 64, 128]
+CANDIDATES = [30, 100, 300]
+KINDS = ["flat", "hnsw"]
+EMBEDDINGS_NPY = None   # optional real (n, FULL_DIM) model outputs instead of synthetic ones
+
+def matryoshka_like(n, dim, seed=0, clusters=200):
+    """Clustered vectors whose energy decays along the dimensions, as in Matryoshka-trained output."""
+    rng = np.random.default_rng(seed)
+    scale = (1 + np.arange(dim)) ** -0.5
+    centers = rng.standard_normal((clusters, dim)).astype("float32")
+    x = (centers[rng.integers(0, clusters, n)] + 0.6 * rng.standard_normal((n, dim))) * scale
+    return (x / np.linalg.norm(x, axis=1, keepdims=True)).astype("float32")
+
+def per_query_ms(fn, queries):
+    t0 = time.perf_counter()
+    for q in queries:
+        fn(q[None])
+    return (time.perf_counter() - t0) * 1000 / len(queries)
+
+def main():
+    faiss.omp_set_num_threads(1)  # single-thread latency, as on an edge CPU
+    if EMBEDDINGS_NPY:
+        data = np.load(EMBEDDINGS_NPY).astype("float32")[:NUM_VECTORS + NUM_QUERIES]
+        data /= np.linalg.norm(data, axis=1, keepdims=True)
+    else:
+        data = matryoshka_like(NUM_VECTORS + NUM_QUERIES, FULL_DIM)
+    base, queries = data[:-NUM_QUERIES], data[-NUM_QUERIES:]
+    full16 = base.astype("float16")   # what the chunk stores keep for reranking
+
+    exact = faiss.IndexFlatIP(FULL_DIM)
+    exact.add(base)
+    _, truth = exact.search(queries, TOP_K)
+    full_ms = per_query_ms(lambda q: exact.search(q, TOP_K), queries)
+
+    print(f"\nMatryoshka two-stage search: {len(base)} x {FULL_DIM}-d, {NUM_QUERIES} queries, top-{TOP_K}")
+    print("-" * 74)
+    print(f"{'Index':<6} {'Coarse':>6} {'Cands':>6} {'Index MB':>9} {'ms/query':>9} {'vs full':>8} {f'Recall@{TOP_K}':>10}")
+    print(f"{'flat':<6} {FULL_DIM:>6} {'-':>6} {base.nbytes / 1e6:>9.1f} {full_ms:>9.3f} {1.0:>8.2f} {1.0:>10.3f}")
+
+    for kind in KINDS:
+        for dim in COARSE_DIMS:
+            builder = IndexBuilder(FULL_DIM, kind, coarse_dim=dim)
+            builder.add(base)
+            index = builder.finish()
+            size_mb = faiss.serialize_index(index).nbytes / 1e6
+            for cands in CANDIDATES:
+                def search(q):
+                    _, ids = index.search(coarse(q, dim), cands)
+                    return rerank(q, ids, lambda i: full16[i], TOP_K)
+                ms = per_query_ms(search, queries)
+                _, found = search(queries)
+                print(f"{kind:<6} {dim:>6} {cands:>6} {size_mb:>9.1f} {ms:>9.3f} {full_ms / ms:>7.1f}x "
+                      f"{recall_at_k(found, truth):>10.3f}")
+
+if __name__ == "__main__":
+    main()
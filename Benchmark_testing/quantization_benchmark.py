@@ -0,0 +1,65 @@
+import os, sys, time
+import faiss
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ann_index_benchmark import recall_at_k, synthetic_vectors
+from index_factory import IndexBuilder, encode
+from matryoshka import rerank
+
+DIM = 128
+NUM_VECTORS = 100_000
+NUM_QUERIES = 200
+TOP_K = 15
+KINDS = ["flat", "hnsw"]
+ENCODINGS = ["float", "int8", "binary"]
+BINARY_CANDIDATES = [100, 500, 2000]
+EMBEDDINGS_NPY = None   # optional real (n, DIM) model outputs instead of synthetic ones
+
+def per_query_ms(fn, queries):
+    t0 = time.perf_counter()
+    for q in queries:
+        fn(q[None])
+    return (time.perf_counter() - t0) * 1000 / len(queries)
+
+def main():
+    faiss.omp_set_num_threads(1)  # single-thread latency, as on an edge CPU
+    if EMBEDDINGS_NPY:
+        data = np.load(EMBEDDINGS_NPY).astype("float32")[:NUM_VECTORS + NUM_QUERIES, :DIM]
+        data /= np.linalg.norm(data, axis=1, keepdims=True)
+    else:
+        data = synthetic_vectors(NUM_VECTORS + NUM_QUERIES, DIM)
+    base, queries = data[:-NUM_QUERIES], data[-NUM_QUERIES:]
+    full16 = base.astype("float16")   # what the chunk stores keep for reranking binary codes
+
+    exact = faiss.IndexFlatIP(DIM)
+    exact.add(base)
+    _, truth = exact.search(queries, TOP_K)
+    float_mb = None
+
+    print(f"\nQuantised vector storage: {len(base)} x {DIM}-d, {NUM_QUERIES} queries, top-{TOP_K}")
+    print("-" * 72)
+    print(f"{'Index':<6} {'Encoding':<8} {'Rerank':>6} {'Index MB':>9} {'Shrink':>7} {'ms/query':>9} {f'Recall@{TOP_K}':>10}")
+    for kind in KINDS:
+        for enc in ENCODINGS:
+            builder = IndexBuilder(DIM, kind, encoding=enc)
+            builder.add(base)
+            index = builder.finish()
+            size_mb = (faiss.serialize_index_binary(index) if enc == "binary" else faiss.serialize_index(index)).nbytes / 1e6
+            if enc == "float":
+                float_mb = size_mb
+
+            for cands in (BINARY_CANDIDATES if enc == "binary" else [0]):
+                if cands:
+                    def search(q):
+                        _, ids = index.search(encode(q, enc), cands)
+                        return rerank(q, ids, lambda i: full16[i], TOP_K)
+                else:
+                    search = lambda q: index.search(q, TOP_K)
+                ms = per_query_ms(search, queries)
+                _, found = search(queries)
+                print(f"{kind:<6} {enc:<8} {cands or '-':>6} {size_mb:>9.1f} {float_mb / size_mb:>6.1f}x "
+                      f"{ms:>9.3f} {recall_at_k(found, truth):>10.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+import json, os, sys, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from http_client import RemoteClient
+
+NUM_CHUNKS = 2000
+EMBED_DIM = 128
+BATCH_SIZES = [8, 16, 32, 64, 128, 256]
+MAX_IN_FLIGHT = 4
+CALL_OVERHEAD_S = 0.02    # simulated per-request cost (handshake, queueing)
+PER_ITEM_S = 0.0005       # simulated per-chunk model cost
+
+class StubEmbedHandler(BaseHTTPRequestHandler):
+    """Stand-in for the hosted /embed endpoint: random unit vectors after a simulated delay."""
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        chunks = json.loads(body)["chunks"]
+        time.sleep(CALL_OVERHEAD_S + PER_ITEM_S * len(chunks))
+        vecs = np.random.rand(len(chunks), EMBED_DIM).astype("float32")
+        vecs /= np.linalg.norm(vecs, axis=1, keepdims=True)
+        out = json.dumps({"embeddings": vecs.tolist()}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(out)))
+        self.end_headers()
+        self.wfile.write(out)
+
+    def log_message(self, *args):
+        pass
+
+def start_stub():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubEmbedHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    server = start_stub()
+    url = f"http://127.0.0.1:{server.server_address[1]}/embed"
+    texts = [f"chunk {i} " + "lorem ipsum " * 40 for i in range(NUM_CHUNKS)]
+
+    print(f"\nRemote embedding throughput ({NUM_CHUNKS} chunks, {MAX_IN_FLIGHT} in flight)")
+    print("-" * 62)
+    print(f"{'Batch':>6} {'Calls':>6} {'Total (s)':>10} {'Chunks/s':>10} {'p50 call (ms)':>14} {'p95':>8}")
+    for bs in BATCH_SIZES:
+        client = RemoteClient(embed_url=url, batch_size=bs, max_in_flight=MAX_IN_FLIGHT)
+        t0 = time.perf_counter()
+        vecs = client.embed(texts)
+        elapsed = time.perf_counter() - t0
+        assert vecs.shape == (NUM_CHUNKS, EMBED_DIM)
+        st = client.stats()["embed"]
+        print(f"{bs:>6} {st['calls']:>6} {elapsed:>10.2f} {NUM_CHUNKS / elapsed:>10.0f} "
+              f"{st['p50_ms']:>14.1f} {st['p95_ms']:>8.1f}")
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -1,105 +1,198 @@
-import os
-import re
-import arxiv
+"""
+Downloads arXiv PDFs for a topic with a bounded worker pool.
+
+    python collect.py "retrieval augmented generation" -n 200 --workers 8
+    python collect.py --urls urls.txt -o download/local   # one "id url [title]" per line
+
+Each file is named after its paper id (titles repeat) and written to <id>.pdf.part,
+resumed with an HTTP Range request after a crash, then renamed into place when
+complete. manifest.jsonl in the output folder records id, title, url, path, size and
+sha256; only papers listed there count as done and are skipped.
+"""
+import argparse, hashlib, json, os, re, threading, time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlparse
+
 import requests
-from tqdm import tqdm  
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from tqdm import tqdm
+
+BLOCK_SIZE = 1024 * 1024
+RETRY_STATUS = (429, 500, 502, 503, 504)
 
 def sanitize_filename(filename):
     filename = re.sub(r'[<>:"/\\|?*]', '_', filename)
     return filename[:150] + '.pdf'
 
-topic = input("Enter the topic: ").strip()
-if not topic:
-    print("Topic cannot be empty!")
-    exit()
-
-try:
-    num_papers = int(input("Enter the number of papers to download: ").strip())
-    if num_papers <= 0:
-        raise ValueError
-except ValueError:
-    print("Please enter a valid positive number.")
-    exit()
-
-download_dir = "download"
-topic_dir = os.path.join(download_dir, sanitize_filename(topic.replace(" ", "_")[:-4]))  # Remove .pdf if added
-os.makedirs(topic_dir, exist_ok=True)
-
-print(f"\nSearching arXiv for: '{topic}'")
-print(f"Goal: Download {num_papers} PDFs into '{topic_dir}'\n")
-
-client = arxiv.Client(
-    page_size=500,
-    delay_seconds=3.0,
-    num_retries=5
-)
-
-search = arxiv.Search(
-    query=topic,
-    max_results=None, 
-    sort_by=arxiv.SortCriterion.SubmittedDate,
-    sort_order=arxiv.SortOrder.Descending
-)
-
-downloaded_count = 0
-results_generator = client.results(search)
-
-print("Starting search and downloads...\n")
-
-for result in results_generator:
-    if downloaded_count >= num_papers:
-        break
-
-    title = result.title or "Untitled"
-    safe_filename = sanitize_filename(title)
-    filepath = os.path.join(topic_dir, safe_filename)
-
-    if os.path.exists(filepath):
-        print(f"Already exists ({downloaded_count + 1}/{num_papers}): {title}")
-        downloaded_count += 1
-        continue
-
-    pdf_url = result.pdf_url
-    if not pdf_url:
-        print(f"No PDF URL for: {title}")
-        continue
-
-    try:
-        print(f"Downloading ({downloaded_count + 1}/{num_papers}): {title}")
-
-        response = requests.get(pdf_url, stream=True, timeout=30)
-        response.raise_for_status()
-
-        total_size = int(response.headers.get('content-length', 0))
-        block_size = 1024 * 1024  
-
-        with open(filepath, 'wb') as f, tqdm(
-            total=total_size,
-            unit='B',
-            unit_scale=True,
-            desc=safe_filename[:40],  
-            leave=False
-        ) as pbar:
-            for chunk in response.iter_content(chunk_size=block_size):
-                if chunk:
+def sha256_file(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(BLOCK_SIZE), b""):
+            h.update(block)
+    return h.hexdigest()
+
+class HostRateLimiter:
+    """Spaces requests to each host at least 1/rate seconds apart, across all workers."""
+
+    def __init__(self, rate_per_s):
+        self.interval = 1.0 / rate_per_s if rate_per_s > 0 else 0.0
+        self.lock = threading.Lock()
+        self.next_slot = {}
+
+    def wait(self, url):
+        host = urlparse(url).netloc
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+class Manifest:
+    """Append-only JSONL of completed downloads, keyed by paper id."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.done = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # torn last line from a crash
+                    self.done[entry["id"]] = entry
+
+    def complete(self, paper_id, out_dir):
+        entry = self.done.get(paper_id)
+        if entry is None:
+            return False
+        path = os.path.join(out_dir, entry["path"])
+        return os.path.exists(path) and os.path.getsize(path) == entry["size"]
+
+    def add(self, entry):
+        with self.lock:
+            self.done[entry["id"]] = entry
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+
+def make_session(pool_size, retries=3, backoff=1.0):
+    retry = Retry(total=retries, backoff_factor=backoff, status_forcelist=RETRY_STATUS,
+                  allowed_methods=None, raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def download(session, limiter, paper, out_dir, timeout=30):
+    """Fetches one paper into out_dir; returns its manifest entry."""
+    name = sanitize_filename(paper["id"])
+    path = os.path.join(out_dir, name)
+    part = path + ".part"
+    # A file at `path` without a manifest entry is not known to be complete, so it is fetched again
+    have = os.path.getsize(part) if os.path.exists(part) else 0
+    headers = {"Range": f"bytes={have}-"} if have else {}
+    limiter.wait(paper["url"])
+    with session.get(paper["url"], stream=True, timeout=timeout, headers=headers) as r:
+        if r.status_code == 416:  # the partial file is already complete
+            pass
+        else:
+            r.raise_for_status()
+            # A server that ignores Range answers 200 with the whole file
+            with open(part, "ab" if r.status_code == 206 else "wb") as f:
+                for chunk in r.iter_content(chunk_size=BLOCK_SIZE):
                     f.write(chunk)
-                    pbar.update(len(chunk))
-
-        print(f"✓ Saved: {safe_filename}\n")
-        downloaded_count += 1
-
-    except Exception as e:
-        print(f"✗ Failed to download '{title}': {e}")
-        print("Skipping and trying next paper...\n")
-
-print("=" * 60)
-if downloaded_count == num_papers:
-    print(f"SUCCESS! Downloaded all {num_papers} papers.")
-elif downloaded_count > 0:
-    print(f"PARTIAL SUCCESS: Downloaded {downloaded_count}/{num_papers} papers.")
-    print("   → Many recent papers may not have PDFs available yet.")
-else:
-    print(f"FAILED: Downloaded 0/{num_papers} papers.")
-    print("   → Try a more specific topic or add category like 'cat:cs.LG' to query.")
-print(f"Files saved in: {topic_dir}")
-print("Done!")
\ No newline at end of file
+    os.replace(part, path)
+    return {"id": paper["id"], "title": paper["title"], "url": paper["url"], "path": name,
+            "size": os.path.getsize(path), "sha256": sha256_file(path)}
+
+def arxiv_papers(topic):
+    import arxiv
+    client = arxiv.Client(page_size=500, delay_seconds=3.0, num_retries=5)
+    search = arxiv.Search(query=topic, max_results=None,
+                          sort_by=arxiv.SortCriterion.SubmittedDate,
+                          sort_order=arxiv.SortOrder.Descending)
+    for result in client.results(search):
+        if result.pdf_url:
+            yield {"id": result.get_short_id(), "url": result.pdf_url, "title": result.title or "Untitled"}
+
+def url_list(path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            parts = line.strip().split(maxsplit=2)
+            if len(parts) >= 2:
+                yield {"id": parts[0], "url": parts[1], "title": parts[2] if len(parts) > 2 else parts[0]}
+
+def collect(papers, out_dir, num_papers, workers=4, rate_per_host=1.0):
+    """
+    Downloads until num_papers are complete (counting ones finished by earlier runs),
+    keeping at most `workers` downloads in flight. Failed papers are replaced by the
+    next result. Returns (completed, failed).
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = Manifest(os.path.join(out_dir, "manifest.jsonl"))
+    session = make_session(workers)
+    limiter = HostRateLimiter(rate_per_host)
+    papers = iter(papers)
+    completed, failed, pending, seen = 0, 0, {}, set()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool, tqdm(total=num_papers, unit="pdf") as bar:
+        t0 = time.perf_counter()
+        while True:
+            while completed + len(pending) < num_papers and len(pending) < workers:
+                paper = next(papers, None)
+                if paper is None:
+                    break
+                if paper["id"] in seen:
+                    continue  # listed twice: counted (and downloaded) once
+                seen.add(paper["id"])
+                if manifest.complete(paper["id"], out_dir):
+                    completed += 1
+                    bar.update(1)
+                    continue
+                pending[pool.submit(download, session, limiter, paper, out_dir)] = paper
+            if not pending:
+                break
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                paper = pending.pop(fut)
+                try:
+                    manifest.add(fut.result())
+                    completed += 1
+                    bar.update(1)
+                except Exception as e:
+                    failed += 1
+                    tqdm.write(f"✗ Failed to download '{paper['title']}': {e}")
+            bar.set_postfix(pdf_per_s=f"{completed / (time.perf_counter() - t0):.2f}", failed=failed)
+    return completed, failed
+
+def main():
+    parser = argparse.ArgumentParser(description="Download arXiv PDFs for a topic")
+    parser.add_argument("topic", nargs="?", help="arXiv search query, e.g. 'cat:cs.LG attention'")
+    parser.add_argument("-n", "--num-papers", type=int, default=100)
+    parser.add_argument("-o", "--out", help="output folder (default: download/<topic or urls file name>)")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=1.0, help="max requests per second per host")
+    parser.add_argument("--urls", help="file of 'id url [title]' lines to fetch instead of searching arXiv")
+    args = parser.parse_args()
+    if not args.topic and not args.urls:
+        parser.error("give a topic or --urls")
+    if args.num_papers <= 0:
+        parser.error("--num-papers must be positive")
+
+    label = args.topic or os.path.splitext(os.path.basename(args.urls))[0]
+    out_dir = args.out or os.path.join("download", sanitize_filename(label.replace(" ", "_"))[:-4])
+    papers = url_list(args.urls) if args.urls else arxiv_papers(args.topic)
+    print(f"Goal: {args.num_papers} PDFs into '{out_dir}' with {args.workers} workers\n")
+
+    completed, failed = collect(papers, out_dir, args.num_papers, args.workers, args.rate)
+    print("=" * 60)
+    print(f"Downloaded {completed}/{args.num_papers} papers ({failed} failed). Files saved in: {out_dir}")
+    if completed < args.num_papers:
+        print("   → Many recent papers may not have PDFs available yet; try a more specific topic.")
+
+if __name__ == "__main__":
+    main()
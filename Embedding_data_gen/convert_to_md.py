@@ -1,10 +1,71 @@
-import os
+"""
+Converts downloaded PDFs to Markdown on a pool of worker processes.
+
+markdown/manifest.json records, for every source PDF, its size, mtime and sha256
+along with the conversion status. A PDF is reconverted only when it changed (or
+its previous conversion failed). A PDF that takes longer than --timeout seconds has
+its worker killed and replaced, so one pathological file cannot stall the run.
+"""
+import argparse, hashlib, json, multiprocessing as mp, os, queue, time
 from pathlib import Path
-import pymupdf4llm # type: ignore
+
 from tqdm import tqdm
-import argparse
 
-def convert_pdfs_in_download_folder(download_dir="download", markdown_dir="markdown"):
+def sha256_file(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def convert_one(pdf_path, md_path):
+    import pymupdf4llm  # type: ignore
+    md_text = pymupdf4llm.to_markdown(str(pdf_path), ignore_graphics=True)
+    md_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = md_path.with_suffix(".md.tmp")
+    tmp.write_text(md_text, encoding="utf-8")
+    os.replace(tmp, md_path)  # a crash never leaves a truncated .md behind
+
+def worker(wid, tasks, results):
+    while (task := tasks.get()) is not None:
+        rel, pdf_path, md_path = task
+        results.put(("start", wid, rel))
+        t0 = time.perf_counter()
+        try:
+            convert_one(Path(pdf_path), Path(md_path))
+            results.put(("done", wid, rel, None, time.perf_counter() - t0))
+        except Exception as e:
+            results.put(("done", wid, rel, repr(e), time.perf_counter() - t0))
+
+class Manifest:
+    def __init__(self, path):
+        self.path = path
+        self.entries = json.loads(path.read_text(encoding="utf-8")) if path.exists() else {}
+
+    def is_current(self, rel, pdf_path, md_path):
+        """Unchanged size+mtime skips hashing; a touched but identical file keeps its output."""
+        entry, st = self.entries.get(rel), pdf_path.stat()
+        if not entry or entry.get("status") != "ok" or not md_path.exists():
+            return False
+        if (entry["size"], entry["mtime_ns"]) == (st.st_size, st.st_mtime_ns):
+            return True
+        if entry["size"] == st.st_size and entry["sha256"] == sha256_file(pdf_path):
+            entry["mtime_ns"] = st.st_mtime_ns
+            return True
+        return False
+
+    def record(self, rel, pdf_path, status, seconds):
+        st = pdf_path.stat()
+        self.entries[rel] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": sha256_file(pdf_path),
+                             "status": status, "seconds": round(seconds, 3)}
+
+    def save(self):
+        tmp = self.path.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps(self.entries, indent=1), encoding="utf-8")
+        os.replace(tmp, self.path)
+
+def convert_pdfs_in_download_folder(download_dir="download", markdown_dir="markdown", workers=None,
+                                    timeout=300, force=False):
     download_path = Path(download_dir)
     markdown_root = Path(markdown_dir)
     markdown_root.mkdir(exist_ok=True)
@@ -13,44 +74,96 @@ def convert_pdfs_in_download_folder(download_dir="download", markdown_dir="markd
         print(f"Error: '{download_dir}' folder not found!")
         return
 
-    pdf_files = list(download_path.rglob("*.pdf"))
+    pdf_files = sorted(download_path.rglob("*.pdf"))
     if not pdf_files:
         print("No PDF files found in 'download/' or subfolders.")
         return
 
-    print(f"Found {len(pdf_files)} PDF files. Starting conversion to Markdown...\n")
-
-    converted_count = 0
-
-    for pdf_path in tqdm(pdf_files, desc="Converting PDFs"):
-        rel_path = pdf_path.relative_to(download_path).parent
-        md_folder = markdown_root / rel_path
-        md_folder.mkdir(parents=True, exist_ok=True)
+    manifest = Manifest(markdown_root / "manifest.json")
+    jobs = {}
+    for pdf_path in pdf_files:
+        rel = pdf_path.relative_to(download_path).as_posix()
+        md_path = markdown_root / pdf_path.relative_to(download_path).parent / (pdf_path.stem + ".md")
+        if force or not manifest.is_current(rel, pdf_path, md_path):
+            jobs[rel] = (pdf_path, md_path)
+    manifest.save()
+    print(f"Found {len(pdf_files)} PDF files; {len(jobs)} new or changed. Starting conversion to Markdown...\n")
+    if not jobs:
+        return
 
-        md_path = md_folder / (pdf_path.stem + ".md")
+    workers = min(workers or os.cpu_count() or 1, len(jobs))
+    tasks, results = mp.Queue(), mp.Queue()
+    for rel, (pdf_path, md_path) in jobs.items():
+        tasks.put((rel, str(pdf_path), str(md_path)))
+    for _ in range(workers):
+        tasks.put(None)
 
-        if md_path.exists():
-            print(f"Skipping (already exists): {md_path.name}")
-            continue
+    def spawn(wid):
+        p = mp.Process(target=worker, args=(wid, tasks, results), daemon=True)
+        p.start()
+        return p
 
-        try:
-            md_text = pymupdf4llm.to_markdown(str(pdf_path), ignore_graphics=True)
+    procs = {wid: spawn(wid) for wid in range(workers)}
+    running = {}  # wid -> (rel, started)
+    converted, failed, done_bytes = 0, 0, 0
+    t0 = time.perf_counter()
 
-            md_path.write_text(md_text, encoding="utf-8")
+    with tqdm(total=len(jobs), desc="Converting PDFs", unit="pdf") as bar:
+        def finish(rel, error, seconds):
+            nonlocal converted, failed, done_bytes
+            pdf_path = jobs[rel][0]
+            manifest.record(rel, pdf_path, "ok" if error is None else error, seconds)
+            if error is None:
+                converted += 1
+            else:
+                failed += 1
+                tqdm.write(f"✗ Failed: {pdf_path.name} → {error}")
+            done_bytes += pdf_path.stat().st_size
+            elapsed = time.perf_counter() - t0
+            bar.update(1)
+            bar.set_postfix(pdf_per_s=f"{(converted + failed) / elapsed:.2f}",
+                            MB_per_s=f"{done_bytes / 1e6 / elapsed:.1f}", failed=failed)
+            if (converted + failed) % 20 == 0:
+                manifest.save()
 
-            print(f"✓ Converted: {pdf_path.name} → markdown/{rel_path}/{md_path.name}")
-            converted_count += 1
+        while converted + failed < len(jobs):
+            alive = any(p.is_alive() for p in procs.values())
+            try:
+                msg = results.get(timeout=0.5)
+                if msg[0] == "start":
+                    running[msg[1]] = (msg[2], time.perf_counter())
+                else:
+                    running.pop(msg[1], None)
+                    finish(*msg[2:])
+            except queue.Empty:
+                if not alive:
+                    break  # workers flush their results before exiting, so nothing is left to report
 
-        except Exception as e:
-            print(f"✗ Failed: {pdf_path.name} → {e}")
+            now = time.perf_counter()
+            for wid, (rel, started) in list(running.items()):
+                if now - started > timeout:
+                    procs[wid].terminate()
+                    procs[wid].join()
+                    del running[wid]
+                    finish(rel, f"timeout after {timeout}s", now - started)
+                    procs[wid] = spawn(wid)  # takes over the killed worker's place in the queue
 
+    for p in procs.values():
+        p.join(timeout=1)
+    manifest.save()
     print("\n" + "="*60)
-    print(f"Conversion complete! {converted_count}/{len(pdf_files)} PDFs converted.")
+    print(f"Conversion complete! {converted}/{len(jobs)} PDFs converted, {failed} failed "
+          f"in {time.perf_counter() - t0:.1f}s.")
     print(f"All Markdown files saved in '{markdown_dir}/' with same topic folder structure.")
     print("Done!")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Convert downloaded arXiv PDFs to Markdown")
+    parser.add_argument("--download-dir", default="download")
+    parser.add_argument("--markdown-dir", default="markdown")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--timeout", type=float, default=300, help="seconds allowed per PDF")
+    parser.add_argument("--force", action="store_true", help="reconvert every PDF")
     args = parser.parse_args()
 
-    convert_pdfs_in_download_folder()
\ No newline at end of file
+    convert_pdfs_in_download_folder(args.download_dir, args.markdown_dir, args.workers, args.timeout, args.force)
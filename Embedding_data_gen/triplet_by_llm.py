@@ -1,91 +1,219 @@
-import os
-import json
-import time
-import google.generativeai as genai
+"""
+Builds (query, positive, hard negative) training triplets from the Markdown papers.
+
+    python triplet_by_llm.py --workers 8 --rpm 60
+    python triplet_by_llm.py --stub            # offline: no API key or model download, canned
+                                               # questions and hashed bag-of-words embeddings
+
+A teacher LLM writes one question per chunk; requests run on a thread pool spaced
+to --rpm. Each document's chunks are embedded once and cached in --cache-dir, and
+hard negatives for all of its questions come from one query x chunk similarity
+matrix. Triplets are appended per document, and chunks already present in the
+output file are skipped, so an interrupted run resumes where it stopped.
+"""
+import argparse, hashlib, json, os, re, threading, time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from sentence_transformers import SentenceTransformer, util # type: ignore
 
-API_KEY = ""
-BASE_DIR = './markdown'  
+API_KEY = os.environ.get("GEMINI_API_KEY", "")
+BASE_DIR = './markdown'
 OUTPUT_FILE = 'triplets.jsonl'
-MODEL_NAME = 'bge-small-en-v1.5' 
-
-genai.configure(api_key=API_KEY)
-llm = genai.GenerativeModel('gemini-2.5-flash')
-embedder = SentenceTransformer(f'BAAI/{MODEL_NAME}')
-
-
-def generate_query(text_chunk):
-    """Teacher LLM generates a technical question."""
-    prompt = f"""You are an academic expert. Based on the research paper chunk below, 
-    generate ONE highly specific technical question that can only be answered by this text.
-    
-    Text: {text_chunk}
-    
-    Question:"""
-    try:
-        response = llm.generate_content(prompt)
-        if response.text:
-            return response.text.strip()
-        return None
-    except Exception as e:
-        print(f"   [!] API Error: {e}")
-        return None
-
-def get_hard_negative(query, positive_chunk, all_chunks):
-    """Finds a 'distractor' chunk from the same context."""
-    if len(all_chunks) < 2:
-        return "Not enough context for a hard negative."
-    
-    query_emb = embedder.encode(query, convert_to_tensor=True)
-    doc_embs = embedder.encode(all_chunks, convert_to_tensor=True)
-    
-    hits = util.semantic_search(query_emb, doc_embs, top_k=3)[0]
-    
-    for hit in hits:
-        candidate = all_chunks[hit['corpus_id']]
-        if candidate.strip() != positive_chunk.strip():
-            return candidate
-    return all_chunks[0]
-
-
-text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
-
-with open(OUTPUT_FILE, 'a', encoding='utf-8') as f_out:
-    for root, dirs, files in os.walk(BASE_DIR):
-        for filename in files:
-            if filename.endswith('.md'):
-                file_path = os.path.join(root, filename)
-                category = os.path.basename(root) 
-                
-                print(f"\n>>> Processing [{category.upper()}]: {filename}")
-                
+CACHE_DIR = './.triplet_cache'
+MODEL_NAME = 'bge-small-en-v1.5'
+TEACHER_MODEL = 'gemini-2.5-flash'
+CHUNK_SIZE, CHUNK_OVERLAP = 1000, 100
+NO_NEGATIVE = "Not enough context for a hard negative."
+
+PROMPT = """You are an academic expert. Based on the research paper chunk below,
+generate ONE highly specific technical question that can only be answered by this text.
+
+Text: {chunk}
+
+Question:"""
+
+class RateLimiter:
+    """Spaces calls at least 60/rpm seconds apart across all threads."""
+
+    def __init__(self, rpm):
+        self.interval = 60.0 / rpm if rpm > 0 else 0.0
+        self.lock = threading.Lock()
+        self.next_slot = 0.0
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+class GeminiTeacher:
+    def __init__(self, api_key, model=TEACHER_MODEL):
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        self.llm = genai.GenerativeModel(model)
+
+    def __call__(self, chunk):
+        response = self.llm.generate_content(PROMPT.format(chunk=chunk))
+        return response.text.strip() if response.text else None
+
+class StubTeacher:
+    """Offline teacher: asks about the chunk's first sentence."""
+
+    def __call__(self, chunk):
+        sentence = re.split(r"(?<=[.!?])\s", chunk.strip(), maxsplit=1)[0]
+        return f"What does the paper say about: {sentence[:200]}?"
+
+class StubEmbedder:
+    """Offline embedder: hashed bag-of-words, L2-normalised. Deterministic, for --stub runs only."""
+    name = 'stub-hash-384'
+
+    def __init__(self, dim=384):
+        self.dim = dim
+
+    def encode(self, texts, **kwargs):
+        out = np.zeros((len(texts), self.dim), dtype="float32")
+        for i, text in enumerate(texts):
+            for word in re.findall(r"\w+", text.lower()):
+                bucket = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=4).digest(), "little")
+                out[i, bucket % self.dim] += 1
+        return out / np.maximum(np.linalg.norm(out, axis=1, keepdims=True), 1e-12)
+
+def make_generator(teacher, limiter, retries=3, backoff=2.0):
+    """Wraps a teacher with rate limiting and exponential backoff; failures return None."""
+    def generate_query(chunk):
+        for attempt in range(retries + 1):
+            limiter.wait()
+            try:
+                return teacher(chunk)
+            except Exception as e:
+                if attempt == retries:
+                    print(f"   [!] API Error: {e}")
+                    return None
+                time.sleep(backoff * 2 ** attempt)
+    return generate_query
+
+class ChunkEmbeddings:
+    """Per-document chunk embeddings, computed once and kept as .npy files keyed by content."""
+
+    def __init__(self, embedder, model_name, cache_dir):
+        self.embedder = embedder
+        self.model_name = model_name
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def encode(self, texts):
+        return np.asarray(self.embedder.encode(texts, batch_size=64, normalize_embeddings=True,
+                                               convert_to_numpy=True), dtype="float32")
+
+    def for_document(self, chunks):
+        h = hashlib.sha256(self.model_name.encode())
+        for c in chunks:
+            h.update(b"\0" + c.encode("utf-8"))
+        path = os.path.join(self.cache_dir, h.hexdigest()[:32] + ".npy")
+        if os.path.exists(path):
+            return np.load(path)
+        embs = self.encode(chunks)
+        np.save(path + ".tmp.npy", embs)
+        os.replace(path + ".tmp.npy", path)
+        return embs
+
+def hard_negatives(query_embs, chunk_embs, pos_idx, chunks):
+    """
+    For each query, the most similar chunk whose text differs from its positive.
+    One (queries x chunks) matrix product; returns chunk indices, -1 when none.
+    """
+    text_ids = {}
+    ids = np.array([text_ids.setdefault(c.strip(), len(text_ids)) for c in chunks])
+    sims = query_embs @ chunk_embs.T
+    sims[ids[None, :] == ids[pos_idx][:, None]] = -np.inf
+    best = sims.argmax(axis=1)
+    return np.where(np.isfinite(sims[np.arange(len(best)), best]), best, -1)
+
+def completed_chunks(path):
+    """(source, chunk index) pairs already written to the output file."""
+    done = set()
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
                 try:
-                    with open(file_path, 'r', encoding='utf-8') as f_in:
-                        content = f_in.read()
-                    
-                    doc_chunks = text_splitter.split_text(content)
-                    print(f"    Found {len(doc_chunks)} chunks.")
-
-                    for i, chunk in enumerate(doc_chunks):
-                        time.sleep(2) 
-                        
-                        query = generate_query(chunk)
-                        if not query: continue
-                        
-                        hard_neg = get_hard_negative(query, chunk, doc_chunks)
-                        
-                        triplet = {
-                            "query": query,
-                            "pos": [chunk],
-                            "neg": [hard_neg],
-                            "meta": {"source": filename, "category": category}
-                        }
-                        
-                        f_out.write(json.dumps(triplet) + '\n')
-                        print(f"    Done {i+1}/{len(doc_chunks)}", end='\r')
-                        
-                except Exception as e:
-                    print(f"   [!!] Failed to process {filename}: {e}")
-
-print("\n\nSuccess! 150 files processed into triplets.jsonl")
\ No newline at end of file
+                    meta = json.loads(line)["meta"]
+                    done.add((meta["path"], meta["chunk"]))
+                except (json.JSONDecodeError, KeyError):
+                    continue  # torn last line, or a triplet from before chunk tracking
+    return done
+
+def markdown_files(base_dir):
+    for root, _, files in sorted(os.walk(base_dir)):
+        for filename in sorted(files):
+            if filename.endswith('.md'):
+                yield os.path.join(root, filename)
+
+def run(base_dir, output_file, generate_query, embeddings, workers):
+    splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    done = completed_chunks(output_file)
+    written, t0 = 0, time.perf_counter()
+    print(f"Resuming with {len(done)} triplets already in {output_file}" if done else f"Writing {output_file}")
+
+    with open(output_file, 'a', encoding='utf-8') as f_out, ThreadPoolExecutor(max_workers=workers) as pool:
+        for file_path in markdown_files(base_dir):
+            rel = os.path.relpath(file_path, base_dir).replace(os.sep, "/")
+            filename, category = os.path.basename(file_path), os.path.basename(os.path.dirname(file_path))
+            try:
+                with open(file_path, 'r', encoding='utf-8') as f_in:
+                    doc_chunks = splitter.split_text(f_in.read())
+                todo = [i for i in range(len(doc_chunks)) if (rel, i) not in done]
+                if not todo:
+                    continue
+                print(f"\n>>> Processing [{category.upper()}]: {filename} ({len(todo)}/{len(doc_chunks)} chunks)")
+
+                queries = list(pool.map(generate_query, [doc_chunks[i] for i in todo]))
+                pairs = [(i, q) for i, q in zip(todo, queries) if q]
+                if not pairs:
+                    continue
+                pos_idx = np.array([i for i, _ in pairs])
+                negs = hard_negatives(embeddings.encode([q for _, q in pairs]),
+                                      embeddings.for_document(doc_chunks), pos_idx, doc_chunks)
+
+                for (i, query), neg in zip(pairs, negs):
+                    triplet = {
+                        "query": query,
+                        "pos": [doc_chunks[i]],
+                        "neg": [doc_chunks[neg] if neg >= 0 else NO_NEGATIVE],
+                        "meta": {"source": filename, "category": category, "path": rel, "chunk": i}
+                    }
+                    f_out.write(json.dumps(triplet) + '\n')
+                f_out.flush()  # one document is the checkpoint unit
+                written += len(pairs)
+                print(f"    Done {len(pairs)}/{len(todo)}  ({written / (time.perf_counter() - t0):.2f} triplets/s)")
+            except Exception as e:
+                print(f"   [!!] Failed to process {filename}: {e}")
+    return written
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate query/positive/hard-negative triplets")
+    parser.add_argument("--base-dir", default=BASE_DIR)
+    parser.add_argument("-o", "--output", default=OUTPUT_FILE)
+    parser.add_argument("--cache-dir", default=CACHE_DIR, help="per-document chunk embedding cache")
+    parser.add_argument("--workers", type=int, default=8, help="concurrent teacher requests")
+    parser.add_argument("--rpm", type=float, default=60, help="max teacher requests per minute")
+    parser.add_argument("--stub", action="store_true", help="use an offline stub instead of the teacher LLM")
+    args = parser.parse_args()
+    if not args.stub and not API_KEY:
+        parser.error("set GEMINI_API_KEY or pass --stub")
+
+    teacher = StubTeacher() if args.stub else GeminiTeacher(API_KEY)
+    generate_query = make_generator(teacher, RateLimiter(0 if args.stub else args.rpm))
+    if args.stub:
+        embeddings = ChunkEmbeddings(StubEmbedder(), StubEmbedder.name, args.cache_dir)
+    else:
+        from sentence_transformers import SentenceTransformer  # type: ignore
+        embeddings = ChunkEmbeddings(SentenceTransformer(f'BAAI/{MODEL_NAME}'), MODEL_NAME, args.cache_dir)
+
+    written = run(args.base_dir, args.output, generate_query, embeddings, args.workers)
+    print(f"\n\nSuccess! {written} new triplets appended to {args.output}")
+
+if __name__ == "__main__":
+    main()
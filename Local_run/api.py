@@ -1,10 +1,19 @@
+import asyncio
 import os
 import shutil
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
 from fastapi import FastAPI, UploadFile, File, HTTPException
 from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
 from ingest import Ingestor
 from engine import RAGEngine
+from reranker import RERANK_MODEL, CrossEncoder
+from collection import Collection
+from scheduler import AsyncAdmission, QueueFull, iterate_in_executor
+from answer_cache import AnswerCache
+from tracing import tracer
 
 app = FastAPI(
     title="Paper-Grounded RAG API",
@@ -15,69 +24,137 @@ app = FastAPI(
 # ================= CONFIG =================
 MODEL_DIR = r"rag/bge-onnx-int8"
 LLM_PATH = r"rag/llama-b7564-bin-win-cpu-x64/qwen2.5-1.5b-instruct-q4_k_m.gguf"
-INDEX_PATH = "faiss.index"
-META_PATH = "meta.json"
+COLLECTION_DIR = "collection"
+EMBED_DIM = 128
 UPLOAD_DIR = "uploads"
+MAX_QUEUED = 16
+QUEUE_TIMEOUT_S = 120
+SYSTEM_PROMPT = "You are a paper-grounded assistant. Use ONLY the context."
+PROMPT_CACHE_DIR = os.path.join(COLLECTION_DIR, "prompt_states")
+# With a cross-encoder reranking the 15 dense candidates, fewer chunks reach the prompt
+RERANKER = CrossEncoder(RERANK_MODEL) if RERANK_MODEL else None
+FINAL_K = 3 if RERANKER else 4
+
+# Blocking work never runs on the event loop: ONNX embedding/ingest and llama.cpp
+# each get their own executor. One llama context serves one completion at a time.
+EMBED_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix="onnx")
+LLM_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="llama")
+admission = AsyncAdmission(max_active=1, max_queue=MAX_QUEUED)
+answers = AnswerCache()
 
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-# Global engine instance
+# Every uploaded PDF is appended to one persistent collection
+collection = Collection(COLLECTION_DIR, EMBED_DIM)
+
+# The tokenizer and ONNX session load once per process and are shared with the engine
+ingestor = Ingestor(MODEL_DIR, embed_dim=EMBED_DIM)
+
+# Global engine instance; it reads the live collection, so uploads never require a reload
 engine = None
 
-# Try to load engine on startup if index exists
-if os.path.exists(INDEX_PATH):
-    engine = RAGEngine(INDEX_PATH, META_PATH, MODEL_DIR, LLM_PATH)
+# Try to load engine on startup if documents exist
+if len(collection):
+    engine = RAGEngine(None, None, MODEL_DIR, LLM_PATH, store=collection,
+                       system_prompt=SYSTEM_PROMPT, prompt_cache_dir=PROMPT_CACHE_DIR, reranker=RERANKER)
 
 class QueryRequest(BaseModel):
     question: str
+    doc_ids: Optional[List[str]] = None
 
 @app.post("/upload", tags=["Ingestion"])
 async def upload_pdf(file: UploadFile = File(...)):
-    """Uploads a PDF, chunks it, and builds a FAISS index."""
+    """Uploads a PDF, chunks it, and appends it to the FAISS collection."""
     if not file.filename.endswith(".pdf"):
         raise HTTPException(status_code=400, detail="Only PDF files are allowed")
     
     file_path = os.path.join(UPLOAD_DIR, file.filename)
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    
-    # Run Ingestion
-    ingestor = Ingestor(MODEL_DIR)
-    ingestor.run_ingestion(file_path, INDEX_PATH, META_PATH)
+
+    def save_upload():
+        with open(file_path, "wb") as buffer:
+            shutil.copyfileobj(file.file, buffer)
+
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(EMBED_EXECUTOR, save_upload)
+    doc_id = await loop.run_in_executor(EMBED_EXECUTOR, lambda: ingestor.ingest_into(collection, file_path, file.filename))
     
-    # Reload Engine with new data
     global engine
-    engine = RAGEngine(INDEX_PATH, META_PATH, MODEL_DIR, LLM_PATH)
+    if engine is None:
+        engine = await loop.run_in_executor(LLM_EXECUTOR, lambda: RAGEngine(
+            None, None, MODEL_DIR, LLM_PATH, store=collection,
+            system_prompt=SYSTEM_PROMPT, prompt_cache_dir=PROMPT_CACHE_DIR, reranker=RERANKER))
     
-    return {"message": "PDF processed and indexed successfully", "filename": file.filename}
+    return {"message": "PDF processed and indexed successfully", "filename": file.filename, "doc_id": doc_id}
+
+@app.get("/documents", tags=["Ingestion"])
+async def list_documents():
+    """Lists the documents in the collection with their chunk ID ranges."""
+    return collection.documents()
+
+@app.delete("/documents/{doc_id}", tags=["Ingestion"])
+async def delete_document(doc_id: str):
+    """Removes one document's chunks from the collection."""
+    if doc_id not in collection.documents():
+        raise HTTPException(status_code=404, detail="Unknown document")
+    # HNSW indexes are rebuilt from the stored vectors here, so keep it off the event loop
+    await asyncio.get_running_loop().run_in_executor(EMBED_EXECUTOR, collection.delete_document, doc_id)
+    return {"deleted": doc_id}
 
 @app.post("/ask", tags=["Retrieval & Generation"])
 async def ask_question(request: QueryRequest):
     """Answers a question based on the uploaded PDF with streaming tokens."""
     global engine
-    if engine is None:
+    if engine is None or not len(collection):
         raise HTTPException(status_code=400, detail="No PDF indexed yet. Please upload a PDF first.")
     
-    chunks = engine.retrieve(request.question)
+    loop = asyncio.get_running_loop()
+    qvec, chunks = await loop.run_in_executor(EMBED_EXECUTOR, lambda: engine.search(request.question, final_k=FINAL_K, doc_ids=request.doc_ids))
     if not chunks:
         return {"answer": "OUT OF CONTEXT", "confidence": 0}
 
+    # Repeated and near-duplicate questions over the same chunks skip the LLM
+    ids, version = [c["id"] for c in chunks], collection.version
+    cached = answers.get(version, ids, request.question, qvec)
+    if cached is not None:
+        return StreamingResponse(iter([cached]), media_type="text/plain")
+
+    try:
+        slot = await admission.acquire(timeout=QUEUE_TIMEOUT_S)
+    except QueueFull:
+        raise HTTPException(status_code=503, detail={"error": "Server busy", **admission.stats()})
+
+    # llama.cpp reuses the cached system/context KV state, so only the question is prefilled on a hit
     def stream_generator():
-        context = "\n\n".join([c["text"] for c in chunks])
-        prompt = (
-            "<|im_start|>system\nYou are a paper-grounded assistant. Use ONLY the context.\n<|im_end|>\n"
-            f"<|im_start|>user\nContext:\n{context}\n\nQuestion:\n{request.question}\n<|im_end|>\n"
-            "<|im_start|>assistant\n"
-        )
-        
-        # Stream from llama-cpp-python
-        for completion in engine.llm.create_completion(
-            prompt=prompt, 
-            max_tokens=300, 
-            temperature=0.2, 
-            stream=True
-        ):
-            token = completion["choices"][0]["text"]
-            yield token
-
-    return StreamingResponse(stream_generator(), media_type="text/plain")
\ No newline at end of file
+        return engine.stream(request.question, chunks)
+
+    return StreamingResponse(
+        admission.stream(slot, answers.arecord(iterate_in_executor(LLM_EXECUTOR, stream_generator), version, ids, request.question, qvec)),
+        media_type="text/plain",
+        headers={"X-Queue-Depth": str(admission.queued)},
+        background=BackgroundTask(slot.release),
+    )
+
+@app.get("/queue", tags=["Retrieval & Generation"])
+async def queue_stats():
+    """Generations running and waiting for the LLM."""
+    return admission.stats()
+
+@app.get("/answer-cache", tags=["Retrieval & Generation"])
+async def answer_cache_stats():
+    """Answer cache entries and hit counts."""
+    return answers.stats()
+
+@app.get("/prompt-cache", tags=["Retrieval & Generation"])
+async def prompt_cache_stats():
+    """Prompt KV-state reuse and the estimated prefill time it saved."""
+    if engine is None:
+        return {}
+    return engine.prompts.stats()
+
+
+@app.get("/metrics", tags=["Retrieval & Generation"])
+async def metrics():
+    """Per-stage latency histograms and counters, plus the queue and cache stats."""
+    return {**tracer.metrics(), "queue": admission.stats(), "answer_cache": answers.stats(),
+            "prompt_cache": engine.prompts.stats() if engine is not None else {},
+            "reranker": RERANKER.stats() if RERANKER is not None else {}}
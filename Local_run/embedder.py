@@ -0,0 +1,148 @@
+import os, sys, threading
+import numpy as np
+import onnxruntime as ort
+from transformers import AutoTokenizer
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tracing import tracer
+
+# BGE models are trained for CLS pooling; ingest and query must pool the same way
+POOLING = os.environ.get("EDGERAG_POOLING", "cls")
+MAX_LENGTH = 512
+ORT_THREADS = int(os.environ.get("EDGERAG_ORT_THREADS", 0))  # 0 = onnxruntime default (physical cores)
+IO_BINDING = os.environ.get("EDGERAG_IO_BINDING", "0") == "1"
+
+def bucket_batches(lengths, token_budget, max_batch):
+    """Groups indices sorted by length so that len(batch) * longest <= token_budget."""
+    order = np.argsort(lengths, kind="stable")
+    batches, cur = [], []
+    for i in order:
+        if cur and ((len(cur) + 1) * lengths[i] > token_budget or len(cur) >= max_batch):
+            batches.append(np.array(cur))
+            cur = []
+        cur.append(i)
+    if cur:
+        batches.append(np.array(cur))
+    return batches
+
+def session_options(intra_threads=ORT_THREADS, inter_threads=1):
+    opts = ort.SessionOptions()
+    opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    opts.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL  # one encoder graph: no parallel branches to use
+    opts.intra_op_num_threads = intra_threads
+    opts.inter_op_num_threads = inter_threads
+    return opts
+
+def load_session(model_dir, opts, optimized_cache=True):
+    """
+    Graph fusions otherwise rerun on every load: the first load saves the fused graph as
+    model.opt-<onnxruntime version>.onnx next to the model and later loads start from it.
+    Only the portable (EXTENDED) level is saved, since model folders get copied between machines.
+    """
+    src = os.path.join(model_dir, "model.onnx")
+    cached = os.path.join(model_dir, f"model.opt-{ort.__version__}.onnx")
+    providers = ["CPUExecutionProvider"]
+    if optimized_cache and os.path.exists(cached) and os.path.getmtime(cached) >= os.path.getmtime(src):
+        return ort.InferenceSession(cached, opts, providers=providers)
+    tmp = cached[:-len(".onnx")] + ".tmp.onnx"
+    if optimized_cache and os.access(model_dir, os.W_OK):
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED
+        opts.optimized_model_filepath = tmp
+    session = ort.InferenceSession(src, opts, providers=providers)
+    if os.path.exists(tmp):
+        os.replace(tmp, cached)
+    return session
+
+class Embedder:
+    """
+    Fast (Rust) tokenizer plus a tuned ONNX session. Texts are tokenized in one batch call,
+    run in length-sorted buckets padded to their longest member, pooled and L2-normalised.
+    """
+
+    def __init__(self, model_dir, pooling=POOLING, intra_threads=ORT_THREADS, inter_threads=1,
+                 io_binding=IO_BINDING, optimized_cache=True, max_length=MAX_LENGTH):
+        if pooling not in ("cls", "mean"):
+            raise ValueError(f"pooling must be 'cls' or 'mean', got {pooling!r}")
+        tokenizer = AutoTokenizer.from_pretrained(model_dir, use_fast=True)
+        if not tokenizer.is_fast:
+            raise ValueError(f"{model_dir} has no tokenizer.json for a fast tokenizer")
+        self.tokenizer = tokenizer.backend_tokenizer
+        self.tokenizer.no_padding()  # buckets are padded here, to their own longest member
+        self.tokenizer.enable_truncation(max_length)
+        self.pad_id = tokenizer.pad_token_id or 0
+        self.pooling = pooling
+        self.io_binding = io_binding
+        self.model_id = f"{os.path.abspath(model_dir)}#{pooling}-l2"
+
+        self.session = load_session(model_dir, session_options(intra_threads, inter_threads), optimized_cache)
+        self.input_types = {i.name: np.int32 if i.type == "tensor(int32)" else np.int64 for i in self.session.get_inputs()}
+        output = self.session.get_outputs()[0]  # last_hidden_state; pooler outputs are never fetched
+        self.output_name = output.name
+        self.hidden_dim = output.shape[-1] if isinstance(output.shape[-1], int) else None
+
+    def tokenize(self, texts):
+        with tracer.span("tokenize", n=len(texts)):
+            return self.tokenizer.encode_batch(list(texts))
+
+    def count_tokens(self, texts):
+        """Token counts without [CLS]/[SEP]; the chunker sizes chunks with these."""
+        with tracer.span("tokenize", n=len(texts)):
+            return [len(e.ids) for e in self.tokenizer.encode_batch(list(texts), add_special_tokens=False)]
+
+    def feed(self, encodings, pad_to=None):
+        """Model inputs for a batch of encodings plus its attention mask."""
+        n = pad_to or max(len(e.ids) for e in encodings)
+        ids = np.full((len(encodings), n), self.pad_id, dtype=np.int64)
+        mask = np.zeros_like(ids)
+        types = np.zeros_like(ids)
+        for r, e in enumerate(encodings):
+            ids[r, :len(e.ids)], mask[r, :len(e.ids)], types[r, :len(e.ids)] = e.ids, 1, e.type_ids
+        arrays = {"input_ids": ids, "attention_mask": mask, "token_type_ids": types}
+        return {k: arrays[k].astype(t, copy=False) for k, t in self.input_types.items()}, mask
+
+    def run(self, inputs):
+        if not self.io_binding:
+            return self.session.run([self.output_name], inputs)[0]
+        binding = self.session.io_binding()
+        for k, v in inputs.items():
+            binding.bind_cpu_input(k, v)
+        binding.bind_output(self.output_name)
+        self.session.run_with_iobinding(binding)
+        return binding.copy_outputs_to_cpu()[0]
+
+    def pool(self, hidden, mask, dim=None):
+        """CLS or masked-mean pooling, cut to the first `dim` (Matryoshka) dims, then normalised."""
+        if self.pooling == "cls":
+            emb = hidden[:, 0]
+        else:
+            m = mask[..., None].astype("float32")
+            emb = (hidden * m).sum(axis=1) / np.maximum(m.sum(axis=1), 1)
+        emb = np.asarray(emb[:, :dim] if dim else emb, dtype="float32")
+        return emb / np.maximum(np.linalg.norm(emb, axis=1, keepdims=True), 1e-12)
+
+    def encode(self, texts, dim=None, token_budget=8192, max_batch=64):
+        """Embeds texts in token-budgeted, length-sorted buckets; rows keep the input order."""
+        if not len(texts):
+            return np.zeros((0, dim or self.hidden_dim or 0), dtype="float32")
+        encodings = self.tokenize(texts)
+        out = None
+        for idx in bucket_batches([len(e.ids) for e in encodings], token_budget, max_batch):
+            inputs, mask = self.feed([encodings[i] for i in idx])
+            with tracer.span("onnx", n=len(idx), tokens=int(mask.size)):
+                hidden = self.run(inputs)
+            vecs = self.pool(hidden, mask, dim)
+            if out is None:
+                out = np.empty((len(texts), vecs.shape[1]), dtype="float32")
+            out[idx] = vecs
+        return out
+
+_embedders = {}
+_embedders_lock = threading.Lock()
+
+def get_embedder(model_dir, **kwargs):
+    """One Embedder per model directory per process, shared by ingest and query; kwargs apply on first load."""
+    key = os.path.abspath(model_dir)
+    with _embedders_lock:
+        if key not in _embedders:
+            _embedders[key] = Embedder(model_dir, **kwargs)
+        return _embedders[key]
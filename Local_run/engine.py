@@ -1,47 +1,102 @@
-import faiss, json, os, sys
-import numpy as np
-import onnxruntime as ort
-from transformers import AutoTokenizer
+import os, sys
 from llama_cpp import Llama
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from embed_cache import get_cache
+from embedder import get_embedder
+from collection import IndexFiles
+from context_builder import CONTEXT_TOKENS, ContextBuilder, passage
+from prompt_cache import PromptCache
+from sparse_index import HYBRID, rrf
+from tracing import tracer
+
+SYSTEM_PROMPT = "Use ONLY the context."
+MIN_SIMILARITY = 0.40  # cosine; ingest and query vectors are both L2-normalised
+
 class RAGEngine:
-    def __init__(self, index_path, meta_path, onnx_dir, llm_path):
-        self.index = faiss.read_index(index_path)
-        with open(meta_path, "r", encoding="utf-8") as f:
-            self.metadata = json.load(f)
-        
-        self.tokenizer = AutoTokenizer.from_pretrained(onnx_dir)
-        self.session = ort.InferenceSession(os.path.join(onnx_dir, "model.onnx"), providers=["CPUExecutionProvider"])
+    def __init__(self, index_path, meta_path, onnx_dir, llm_path, use_cache=True, store=None,
+                 system_prompt=SYSTEM_PROMPT, prompt_cache_bytes=512 << 20, prompt_cache_dir=None,
+                 hybrid=HYBRID, reranker=None, context_tokens=CONTEXT_TOKENS):
+        # store: a Collection, or by default the standalone index/meta files
+        self.store = store if store is not None else IndexFiles(index_path, meta_path)
+
+        self.embedder = get_embedder(onnx_dir)
         self.llm = Llama(model_path=llm_path, n_ctx=4096, n_threads=os.cpu_count(), verbose=False)
-        self.faiss_dim = self.index.d
+        self.faiss_dim = self.store.dim
+        self.cache = get_cache(self.embedder.model_id, self.faiss_dim) if use_cache else None
+        self.system_prompt = system_prompt
+        self.hybrid = hybrid
+        self.reranker = reranker  # optional CrossEncoder over the retrieved candidates
+        self.prompts = PromptCache(self.llm, prompt_cache_bytes, prompt_cache_dir)
+        # Context is budgeted in the LLM's own tokens, which are what prefill costs
+        self.context = ContextBuilder(self.count_tokens, context_tokens)
+
+    def count_tokens(self, texts):
+        return [len(self.llm.tokenize(t.encode("utf-8"), add_bos=False, special=False)) for t in texts]
 
     def embed_query(self, text):
-        encoded = self.tokenizer(text, return_tensors="np", padding=True, truncation=True, max_length=512)
-        inputs = {k: encoded[k] for k in {i.name for i in self.session.get_inputs()}}
-        output = self.session.run(None, inputs)[0]
-        emb = output.mean(axis=1)[:, :self.faiss_dim]
-        emb = emb / np.linalg.norm(emb, axis=1, keepdims=True)
-        return emb.astype("float32")
-
-    def retrieve(self, query, top_k=15, final_k=4):
+        if self.cache is None:
+            return self._encode([text])
+        return self.cache.embed([text], self._encode)
+
+    def _encode(self, texts):
+        return self.embedder.encode(texts, self.faiss_dim)
+
+    def retrieve(self, query, top_k=15, final_k=4, doc_ids=None):
+        return self.search(query, top_k, final_k, doc_ids)[1]
+
+    def search(self, query, top_k=15, final_k=4, doc_ids=None):
+        """Returns (query vector, chunks) where chunks are {"id", "text", "score"} dicts."""
         qvec = self.embed_query(query)
-        scores, ids = self.index.search(qvec, top_k)
-        chunks = []
+        scores, ids = self.store.search(qvec, top_k, doc_ids)
+        ranked = []
         for raw_score, idx in zip(scores[0], ids[0]):
             if idx == -1: continue
-            sim = max(0.0, min(float(raw_score) / 2.0, 1.0))
-            if sim < 0.40: continue
-            chunks.append({"text": self.metadata[str(idx)]["text"], "score": sim})
-        chunks.sort(key=lambda x: x["score"], reverse=True)
-        return chunks[:final_k]
+            sim = max(0.0, min(float(raw_score), 1.0))
+            if sim < MIN_SIMILARITY: continue
+            ranked.append((int(idx), sim))
+        ranked.sort(key=lambda x: x[1], reverse=True)
+
+        if self.hybrid and ranked:  # BM25 alone never makes a query answerable (see engine_remote)
+            _, sparse = self.store.sparse_search(query, top_k, doc_ids)
+            fused, fused_scores = rrf([[i for i, _ in ranked], sparse[0]], top_k if self.reranker else final_k)
+            ranked = list(zip(fused.tolist(), fused_scores.tolist()))
+
+        if self.reranker is None:
+            return qvec, [passage(self.store, i, s) for i, s in ranked[:final_k]]
+        hits = [passage(self.store, i, s) for i, s in ranked]
+        order = self.reranker.rerank(query, [h["text"] for h in hits])
+        return qvec, [hits[j] for j in order[:final_k]] if order is not None else hits[:final_k]
+
+    def prompt_segments(self, question, chunks, max_tokens=300):
+        """
+        Splits the prompt into cacheable prefixes: the fixed system block, then the context
+        block, then the question. The context is packed from chunks (best first) into what
+        is left of n_ctx after the rest of the prompt and the answer, and at most the
+        configured budget; passages go in ID order so the same selection always produces
+        the same context prefix regardless of score order.
+        """
+        system = f"<|im_start|>system\n{self.system_prompt}\n<|im_end|>\n<|im_start|>user\nContext:\n"
+        question = f"Question:\n{question}\n<|im_end|>\n<|im_start|>assistant\n"
+        room = self.llm.n_ctx() - max_tokens - sum(self.count_tokens([system, question])) - 2
+        vectors = self.store.vectors([c["id"] for c in chunks]) if chunks else None
+        context = self.context.context(chunks, vectors, min(self.context.budget, room))
+        return [system, f"{context}\n\n", question]
+
+    def stream(self, question, chunks, max_tokens=300):
+        """Yields answer tokens, reusing cached KV state for the system and context prefixes."""
+        return tracer.stream(self._completion(question, chunks, max_tokens))
+
+    def _completion(self, question, chunks, max_tokens):
+        # Runs inside the traced stream, so prompt prefill counts toward time to first token
+        with tracer.span("prompt_build"):
+            tokens = self.prompts.prepare(self.prompt_segments(question, chunks, max_tokens))
+        for c in self.llm.create_completion(prompt=tokens, max_tokens=max_tokens, temperature=0.2, stream=True):
+            yield c["choices"][0]["text"]
 
     def generate(self, question, chunks):
-        context = "\n\n".join([c["text"] for c in chunks])
-        prompt = f"<|im_start|>system\nUse ONLY the context.\n<|im_end|>\n<|im_start|>user\nContext:\n{context}\n\nQuestion:\n{question}\n<|im_end|>\n<|im_start|>assistant\n"
-        
         output = ""
-        for c in self.llm.create_completion(prompt=prompt, max_tokens=300, temperature=0.2, stream=True):
-            token = c["choices"][0]["text"]
+        for token in self.stream(question, chunks):
             sys.stdout.write(token); sys.stdout.flush()
             output += token
-        return output.strip()
\ No newline at end of file
+        return output.strip()
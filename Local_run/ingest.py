@@ -1,87 +1,202 @@
-import io, re, json, uuid, fitz, faiss, os
-import numpy as np
-import onnxruntime as ort
-import pytesseract
-from PIL import Image
-from transformers import AutoTokenizer
+import fitz, os, queue, sys, threading
+from concurrent.futures import ProcessPoolExecutor
 from tqdm import tqdm
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from embed_cache import get_cache
+from embedder import get_embedder
+from index_factory import IndexBuilder
+from matryoshka import COARSE_DIM
+from chunk_store import ChunkStoreWriter
+from chunker import CHUNK_TOKENS, Chunker, chunk_pages
+from ocr import DocumentOCR, OCRCache
+from tracing import tracer
+
+_DONE = object()
+
+class _Stopped(Exception):
+    """Raised inside a stage once another stage has failed."""
+
+def _put(q, item, stop):
+    """Queue.put that gives up once `stop` is set, so no stage blocks on a queue nobody drains."""
+    while not stop.is_set():
+        try:
+            return q.put(item, timeout=0.1)
+        except queue.Full:
+            pass
+    raise _Stopped
+
+def _get(q, stop):
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            pass
+    raise _Stopped
+
+class _Stage(threading.Thread):
+    """Daemon thread that records its exception, stops the pipeline on failure and signals downstream on exit."""
+    def __init__(self, target, out_q, stop):
+        super().__init__(daemon=True)
+        self.target, self.out_q, self.stop, self.error = target, out_q, stop, None
+
+    def run(self):
+        try:
+            self.target()
+        except _Stopped:
+            pass
+        except BaseException as e:
+            self.error = e
+            self.stop.set()
+        finally:
+            try:
+                _put(self.out_q, _DONE, self.stop)
+            except _Stopped:
+                pass
+
 class Ingestor:
-    def __init__(self, model_dir, embed_dim=128, chunk_size=500, chunk_overlap=100):
+    def __init__(self, model_dir, embed_dim=128, chunk_tokens=CHUNK_TOKENS,
+                 ocr_workers=None, queue_size=64, stream_batch=32, use_cache=True,
+                 index_kind=None, coarse_dim=COARSE_DIM, encoding=None, ocr_cache=True):
         self.model_dir = model_dir
         self.embed_dim = embed_dim
-        self.chunk_size = chunk_size
-        self.chunk_overlap = chunk_overlap
-        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
-        self.session = ort.InferenceSession(
-            os.path.join(model_dir, "model.onnx"),
-            providers=["CPUExecutionProvider"]
-        )
-        self.input_names = {i.name for i in self.session.get_inputs()}
-        self.section_patterns = {
-            "abstract": re.compile(r"\babstract\b", re.I),
-            "introduction": re.compile(r"\bintroduction\b", re.I),
-            "methods": re.compile(r"\b(methods?|materials)\b", re.I),
-            "results": re.compile(r"\bresults?\b", re.I),
-            "discussion": re.compile(r"\bdiscussion\b", re.I),
-            "conclusion": re.compile(r"\bconclusion\b", re.I),
-        }
-        self.figure_regex = re.compile(r"\b(fig\.?|figure|table)\b", re.I)
-
-    def detect_section(self, text, current_section):
-        head = text[:300]
-        for sec, pat in self.section_patterns.items():
-            if pat.search(head): return sec
-        return current_section
-
-    def embed_batch(self, texts, batch_size=8):
-        all_vecs = []
-        for i in range(0, len(texts), batch_size):
-            batch = texts[i:i + batch_size]
-            encoded = self.tokenizer(batch, padding="max_length", truncation=True, max_length=512, return_tensors="np")
-            inputs = {k: encoded[k] for k in self.input_names}
-            outputs = self.session.run(None, inputs)[0]
-            vecs = outputs[:, 0, :] # CLS Pooling
-            all_vecs.append(vecs[:, :self.embed_dim].astype("float32"))
-        return np.vstack(all_vecs)
-
-    def chunk_text(self, text):
-        chunks = []
-        start = 0
-        while start < len(text):
-            end = start + self.chunk_size
-            chunks.append(text[start:end])
-            start = end - self.chunk_overlap
-        return chunks
-
-    def run_ingestion(self, pdf_path, index_path, meta_path):
-        doc = fitz.open(pdf_path)
-        records = []
-        current_section = "unknown"
-        
-        for pidx, page in enumerate(tqdm(doc, desc="Ingesting PDF")):
-            page_text = page.get_text().strip()
-            if page_text:
-                current_section = self.detect_section(page_text, current_section)
-                for i, ch in enumerate(self.chunk_text(page_text)):
-                    records.append({"text": ch, "metadata": {"page": pidx+1, "section": current_section, "type": "text"}})
-            
-            # OCR Figures
-            for img in page.get_images(full=True):
-                img_dict = doc.extract_image(img[0])
-                ocr_text = pytesseract.image_to_string(Image.open(io.BytesIO(img_dict["image"])).convert("RGB")).strip()
-                if ocr_text:
-                    for i, ch in enumerate(self.chunk_text(ocr_text)):
-                        records.append({"text": ch, "metadata": {"page": pidx+1, "section": current_section, "type": "figure"}})
-
-        print("Embedding chunks...")
-        embeddings = self.embed_batch([r["text"] for r in records])
-        
-        index = faiss.IndexFlatIP(self.embed_dim)
-        index.add(embeddings)
-        faiss.write_index(index, index_path)
-        
-        meta = {i: records[i] for i in range(len(records))}
-        with open(meta_path, "w", encoding="utf-8") as f:
-            json.dump(meta, f, indent=2)
-        return len(records)
\ No newline at end of file
+        self.chunk_tokens = chunk_tokens
+        self.ocr_workers = ocr_workers or max(1, (os.cpu_count() or 2) - 1)
+        self.queue_size = queue_size
+        self.stream_batch = stream_batch
+        self.index_kind = index_kind
+        self.coarse_dim = coarse_dim
+        self.encoding = encoding  # float32 / int8 / binary codes; None = EDGERAG_ENCODING
+        self.embedder = get_embedder(model_dir)
+        self.cache = get_cache(self.embedder.model_id, embed_dim) if use_cache else None
+        self.ocr_cache = OCRCache() if ocr_cache else None
+        self.ocr_stats = {}  # DocumentOCR stats of the last ingested PDF
+        self._pool = None
+
+    def embed_batch(self, texts, token_budget=8192, max_batch=64):
+        """
+        Embeds texts in length-sorted buckets padded only to their longest member.
+        Each bucket holds as many texts as fit in `token_budget` padded tokens;
+        vectors are returned in the original order. Cached texts skip the model.
+        """
+        if self.cache is None:
+            return self._encode(texts, token_budget, max_batch)
+        return self.cache.embed(texts, lambda miss: self._encode(miss, token_budget, max_batch))
+
+    def _encode(self, texts, token_budget, max_batch):
+        return self.embedder.encode(texts, self.embed_dim, token_budget, max_batch)
+
+    def ocr_pool(self):
+        """OCR worker processes, started on first use and kept for later documents."""
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.ocr_workers)
+        return self._pool
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def run_ingestion(self, pdf_path, index_path, chunks_path):
+        """Builds a standalone faiss.index + chunk store for one PDF; returns the chunk count."""
+        return self._stream(pdf_path, _FileSink(index_path, chunks_path, self.embed_dim, self.index_kind,
+                                                    self.coarse_dim, self.encoding))
+
+    def ingest_into(self, collection, pdf_path, name=None):
+        """Appends one PDF to a Collection as a new document; returns its doc_id."""
+        return self._stream(pdf_path, collection.writer(name or os.path.basename(pdf_path)))
+
+    def _stream(self, pdf_path, sink):
+        """
+        Streams the PDF through three overlapping stages joined by bounded queues:
+        page parsing (this process) -> OCR (process pool) -> embedding + sink.add.
+        """
+        chunk_q = queue.Queue(maxsize=self.queue_size)
+        ocr_q = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        images = DocumentOCR(self.ocr_pool(), self.ocr_cache)
+
+        def parse():
+            doc = fitz.open(pdf_path)
+            chunker = Chunker(self.embedder.count_tokens, self.chunk_tokens)
+            try:
+                for pidx, page in enumerate(tqdm(doc, desc="Ingesting PDF")):
+                    with tracer.span("parse", page=pidx+1):
+                        page_text = page.get_text().strip()
+                    tracer.count("pages")
+                    for rec in chunker.add_page(pidx+1, page_text):
+                        _put(chunk_q, rec, stop)
+
+                    # OCR Figures: queue is bounded, so at most queue_size images are in flight
+                    for img in page.get_images(full=True):
+                        if (job := images.submit(doc, img)) is not None:
+                            _put(ocr_q, (job, pidx+1, chunker.section), stop)
+                for rec in chunker.finish():
+                    _put(chunk_q, rec, stop)
+            finally:
+                doc.close()
+
+        def collect_ocr():
+            while (item := _get(ocr_q, stop)) is not _DONE:
+                job, page_no, section = item
+                ocr_text = images.result(job, page_no)
+                if not ocr_text: continue
+                for rec in chunk_pages([(page_no, ocr_text)], count_tokens=self.embedder.count_tokens,
+                                       max_tokens=self.chunk_tokens, section=section, kind="figure"):
+                    _put(chunk_q, rec, stop)
+
+        parser, ocr = _Stage(parse, ocr_q, stop), _Stage(collect_ocr, chunk_q, stop)
+        parser.start(); ocr.start()
+        error = None
+        try:
+            self._embed_stream(chunk_q, sink, stop)
+        except _Stopped:
+            pass  # a stage failed; its error is raised below
+        except BaseException as e:
+            error = e
+            stop.set()
+
+        # Once stop is set every stage gives up on its queues, so these joins cannot hang
+        ocr.join(); parser.join()
+        error = error or ocr.error or parser.error
+        if error is not None:
+            sink.abort()
+            raise error
+
+        self.ocr_stats = images.report(os.path.basename(pdf_path))
+        s = self.ocr_stats
+        print(f"OCR: {s['ocr_runs']} run ({s['ocr_s']:.1f}s), {s['cache_hits']} cached, {s['duplicates']} duplicate, "
+              f"{s['too_small']} too small of {s['images']} images")
+        if self.cache is not None:
+            self.cache.flush()
+        return sink.commit()
+
+    def _embed_stream(self, chunk_q, sink, stop):
+        batch = []
+        while (rec := _get(chunk_q, stop)) is not _DONE:
+            tracer.count("chunks")
+            batch.append(rec)
+            if len(batch) >= self.stream_batch:
+                sink.add(batch, self.embed_batch([r["text"] for r in batch]))
+                batch = []
+        if batch:
+            sink.add(batch, self.embed_batch([r["text"] for r in batch]))
+
+class _FileSink:
+    """Adds vectors to an IndexBuilder and appends records to a chunk store as they arrive."""
+
+    def __init__(self, index_path, chunks_path, dim, index_kind, coarse_dim=0, encoding=None):
+        self.index_path = index_path
+        self.builder = IndexBuilder(dim, index_kind, coarse_dim=coarse_dim, encoding=encoding)
+        self.chunks = ChunkStoreWriter(chunks_path)
+
+    def add(self, records, vecs):
+        self.builder.add(vecs)
+        self.chunks.add(records, vecs if self.builder.rerank else None)
+
+    def commit(self):
+        self.builder.write(self.index_path)
+        return self.chunks.close()
+
+    def abort(self):
+        self.chunks.abort()
@@ -6,7 +6,7 @@ from engine import RAGEngine
 MODEL_DIR = r"C:\Codes\Projects\Actual RAG\rag\bge-onnx-int8"
 LLM_PATH = r"C:\Codes\Projects\Actual RAG\rag\llama-b7564-bin-win-cpu-x64\qwen2.5-1.5b-instruct-q4_k_m.gguf"
 INDEX_PATH = "faiss.index"
-META_PATH = "meta.json"
+CHUNKS_PATH = "chunks"
 
 def main():
     # 1. Ingestion Phase
@@ -17,12 +17,12 @@ def main():
 
     print("\n--- Starting Ingestion ---")
     ingestor = Ingestor(MODEL_DIR)
-    num_chunks = ingestor.run_ingestion(pdf_input, INDEX_PATH, META_PATH)
+    num_chunks = ingestor.run_ingestion(pdf_input, INDEX_PATH, CHUNKS_PATH)
     print(f"✅ Ingestion Complete. Processed {num_chunks} chunks.")
 
     # 2. Retrieval/Generation Phase
     print("\n--- Loading RAG Engine ---")
-    engine = RAGEngine(INDEX_PATH, META_PATH, MODEL_DIR, LLM_PATH)
+    engine = RAGEngine(INDEX_PATH, CHUNKS_PATH, MODEL_DIR, LLM_PATH)
 
     print("\nSystem Ready! Type 'exit' to stop.")
     while True:
@@ -0,0 +1,110 @@
+import hashlib, io, os, sys, time
+from concurrent.futures import Future
+import numpy as np
+import pytesseract
+from PIL import Image
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from embed_cache import CACHE_DIR
+from tracing import tracer
+
+OCR_CACHE_DIR = os.path.join(CACHE_DIR, "ocr")
+MIN_SIDE = 48            # icons, bullets and rules never hold readable text
+MIN_PIXELS = 100 * 100
+MIN_ENTROPY = 0.1        # bits per grey level; only blank or single-colour images fall below
+
+def grey_entropy(image):
+    hist = np.asarray(image.convert("L").histogram(), dtype="float64")
+    p = hist[hist > 0] / hist.sum()
+    return float(-(p * np.log2(p)).sum())
+
+def ocr_image(image_bytes):
+    """Runs in an OCR worker process, so it must stay a picklable module-level function."""
+    image = Image.open(io.BytesIO(image_bytes))
+    if grey_entropy(image) < MIN_ENTROPY:
+        return ""
+    return pytesseract.image_to_string(image.convert("RGB")).strip()
+
+def _timed_ocr(image_bytes):
+    """ocr_image plus its worker-side duration, since the tracer lives in the parent process."""
+    t0 = time.perf_counter()
+    return ocr_image(image_bytes), time.perf_counter() - t0
+
+class OCRCache:
+    """OCR text on disk, one file per image content hash; shared by every document and run."""
+
+    def __init__(self, cache_dir=OCR_CACHE_DIR):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".txt")
+
+    def get(self, key):
+        try:
+            with open(self._path(key), encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, key, text):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp, path)
+
+class DocumentOCR:
+    """
+    OCR front end for one document. Images repeated by xref or content (logos, page
+    decorations) and ones too small to hold text are skipped; cached hashes resolve
+    at once; the rest go to the process pool. stats add up to the document's OCR cost.
+    """
+
+    def __init__(self, pool, cache=None):
+        self.pool = pool
+        self.cache = cache
+        self.xrefs, self.hashes = set(), set()
+        self.stats = {"images": 0, "duplicates": 0, "too_small": 0, "cache_hits": 0, "ocr_runs": 0, "ocr_s": 0.0}
+
+    def submit(self, doc, img):
+        """Returns (future of (text, seconds), image hash), or None when the image is skipped."""
+        xref, width, height = img[0], img[2], img[3]
+        self.stats["images"] += 1
+        if xref in self.xrefs:
+            self.stats["duplicates"] += 1
+            return None
+        self.xrefs.add(xref)
+        if min(width, height) < MIN_SIDE or width * height < MIN_PIXELS:
+            self.stats["too_small"] += 1
+            return None
+        data = doc.extract_image(xref)["image"]
+        key = hashlib.blake2b(data, digest_size=16).hexdigest()
+        if key in self.hashes:
+            self.stats["duplicates"] += 1
+            return None
+        self.hashes.add(key)
+        text = self.cache.get(key) if self.cache is not None else None
+        if text is not None:
+            self.stats["cache_hits"] += 1
+            fut = Future()
+            fut.set_result((text, None))
+            return fut, key
+        self.stats["ocr_runs"] += 1
+        return self.pool.submit(_timed_ocr, data), key
+
+    def result(self, job, page_no):
+        fut, key = job
+        text, seconds = fut.result()
+        if seconds is not None:
+            self.stats["ocr_s"] += seconds
+            tracer.observe("ocr", seconds, page=page_no)
+            if self.cache is not None:
+                self.cache.put(key, text)
+        return text
+
+    def report(self, name):
+        """Records the document's total worker-side OCR time and returns its stats."""
+        tracer.observe("ocr_document", self.stats["ocr_s"], doc=name, **{k: v for k, v in self.stats.items() if k != "ocr_s"})
+        return dict(self.stats)
@@ -0,0 +1,155 @@
+import hashlib, os, pickle, threading, time
+from collections import OrderedDict
+
+class PromptCache:
+    """
+    Keeps llama.cpp KV states for prompt prefixes (system block, system + context block)
+    so later prompts that share a prefix only prefill the tokens after it.
+
+    States live in an in-memory LRU capped at `capacity_bytes`; with `disk_dir` set,
+    evicted states are pickled there and reloaded on a later prefix hit. The disk tier is
+    an LRU of its own capped at `disk_bytes`. Each file starts with its model and token
+    key, so the index is rebuilt from the directory on startup.
+    """
+
+    def __init__(self, llm, capacity_bytes=512 << 20, disk_dir=None, disk_bytes=2 << 30):
+        self.llm = llm
+        self.capacity_bytes = capacity_bytes
+        self.disk_dir = disk_dir
+        self.disk_bytes = disk_bytes
+        self.model = getattr(llm, "model_path", None)
+        self.lock = threading.Lock()
+        self.states = OrderedDict()   # tuple(tokens) -> LlamaState
+        self.on_disk = OrderedDict()  # tuple(tokens) -> (pickle path, bytes), least recently used first
+        self.disk_size = 0
+        self.size = 0
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.reused_tokens = 0
+        self.prefill_tokens = 0
+        self.prefill_seconds = 0.0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._scan_disk()
+
+    def _scan_disk(self):
+        """Indexes states left by earlier runs, oldest use first; unreadable or other-model files go."""
+        files = []
+        for name in os.listdir(self.disk_dir):
+            path = os.path.join(self.disk_dir, name)
+            if name.endswith(".tmp"):
+                os.remove(path)  # torn write
+            if not name.endswith(".state"):
+                continue
+            try:
+                with open(path, "rb") as f:
+                    model, key = pickle.load(f)
+                if model != self.model:
+                    raise ValueError(model)
+                files.append((os.path.getmtime(path), key, path, os.path.getsize(path)))
+            except Exception:
+                os.remove(path)
+        for _, key, path, size in sorted(files, key=lambda f: f[0]):
+            self.on_disk[key] = (path, size)
+            self.disk_size += size
+        self._trim_disk()
+
+    def _trim_disk(self):
+        while self.disk_size > self.disk_bytes and self.on_disk:
+            _, (path, size) = self.on_disk.popitem(last=False)
+            self.disk_size -= size
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def tokenize(self, segments):
+        """Tokenizes segments separately so every segment boundary is a token boundary."""
+        tokens, bounds = [], []
+        for i, seg in enumerate(segments):
+            tokens += self.llm.tokenize(seg.encode("utf-8"), add_bos=(i == 0), special=True)
+            bounds.append(len(tokens))
+        return tokens, bounds[:-1]
+
+    def _live_prefix(self, tokens):
+        n = 0
+        for a, b in zip(self.llm.input_ids[:self.llm.n_tokens], tokens):
+            if a != b: break
+            n += 1
+        return n
+
+    def _best_cached(self, tokens):
+        best = ()
+        for key in list(self.states) + list(self.on_disk):
+            if len(key) > len(best) and len(key) <= len(tokens) and tuple(tokens[:len(key)]) == key:
+                best = key
+        return best
+
+    def _load(self, key):
+        if key in self.states:
+            self.states.move_to_end(key)
+            return self.states[key]
+        path, _ = self.on_disk[key]
+        with open(path, "rb") as f:
+            pickle.load(f)  # header
+            state = pickle.load(f)
+        self.on_disk.move_to_end(key)
+        os.utime(path)
+        self._store(key, state)
+        return state
+
+    def _store(self, key, state):
+        size = getattr(state, "llama_state_size", 0) or len(state.llama_state)
+        self.states[key] = state
+        self.size += size
+        while self.size > self.capacity_bytes and len(self.states) > 1:
+            old_key, old = self.states.popitem(last=False)
+            self.size -= getattr(old, "llama_state_size", 0) or len(old.llama_state)
+            if self.disk_dir and old_key not in self.on_disk:
+                path = os.path.join(self.disk_dir, hashlib.sha1(repr(old_key).encode()).hexdigest() + ".state")
+                with open(path + ".tmp", "wb") as f:
+                    pickle.dump((self.model, old_key), f)
+                    pickle.dump(old, f)
+                os.replace(path + ".tmp", path)
+                self.on_disk[old_key] = (path, os.path.getsize(path))
+                self.disk_size += self.on_disk[old_key][1]
+                self._trim_disk()
+
+    def prepare(self, segments):
+        """
+        Brings the llama context to the longest cached/live prefix of the prompt, prefills
+        and snapshots each segment boundary not yet cached, and returns the prompt tokens.
+        Call under the same lock/thread that then runs create_completion(prompt=tokens).
+        """
+        with self.lock:
+            tokens, bounds = self.tokenize(segments)
+            live = self._live_prefix(tokens)
+            best = self._best_cached(tokens)
+            if len(best) > live:
+                self.llm.load_state(self._load(best))
+                live = len(best)
+
+            self.requests += 1
+            self.prompt_tokens += len(tokens)
+            self.reused_tokens += live
+
+            for b in bounds:
+                if b <= live: continue
+                t0 = time.perf_counter()
+                self.llm.n_tokens = live
+                self.llm.eval(tokens[live:b])
+                self.prefill_seconds += time.perf_counter() - t0
+                self.prefill_tokens += b - live
+                live = b
+                self._store(tuple(tokens[:b]), self.llm.save_state())
+            return tokens
+
+    def stats(self):
+        with self.lock:
+            per_token = self.prefill_seconds / self.prefill_tokens if self.prefill_tokens else 0.0
+            return {"requests": self.requests, "prompt_tokens": self.prompt_tokens,
+                    "reused_tokens": self.reused_tokens,
+                    "reuse_ratio": self.reused_tokens / self.prompt_tokens if self.prompt_tokens else 0.0,
+                    "est_prefill_saved_s": self.reused_tokens * per_token,
+                    "states": len(self.states), "states_on_disk": len(self.on_disk),
+                    "ram_bytes": self.size, "disk_bytes": self.disk_size}
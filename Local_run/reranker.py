@@ -0,0 +1,109 @@
+import os, sys, threading, time
+from collections import deque
+import numpy as np
+import onnxruntime as ort
+from transformers import AutoTokenizer
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from embedder import ORT_THREADS, load_session, session_options
+from tracing import tracer
+
+RERANK_MODEL = os.environ.get("EDGERAG_RERANK_MODEL")  # ONNX cross-encoder dir; unset = no rerank stage
+BUDGET_MS = float(os.environ.get("EDGERAG_RERANK_BUDGET_MS", 150))
+PROBE_EVERY = 20  # after this many skips in a row one call runs anyway, to re-measure the cost
+
+class CrossEncoder:
+    """
+    Scores (query, passage) pairs with an ONNX cross-encoder in one padded batch per query.
+    A call predicted to exceed `budget_ms` (from the measured cost per token) is skipped,
+    and a run still going at the deadline is terminated; either way rerank() returns None
+    and the caller keeps the dense order. Every `probe_every`-th call in a row that would be
+    skipped runs instead, so one slow period cannot switch the stage off for good.
+    """
+
+    def __init__(self, model_dir, budget_ms=BUDGET_MS, max_length=512, intra_threads=ORT_THREADS,
+                 probe_every=PROBE_EVERY):
+        tokenizer = AutoTokenizer.from_pretrained(model_dir, use_fast=True)
+        if not tokenizer.is_fast:
+            raise ValueError(f"{model_dir} has no tokenizer.json for a fast tokenizer")
+        self.tokenizer = tokenizer.backend_tokenizer
+        self.tokenizer.no_padding()
+        self.tokenizer.enable_truncation(max_length, strategy="only_second")  # cut the passage, never the query
+        self.pad_id = tokenizer.pad_token_id or 0
+        self.budget_ms = budget_ms
+        self.probe_every = probe_every
+        self.skip_run = 0  # skips since the last call that ran
+        self.session = load_session(model_dir, session_options(intra_threads))
+        self.input_types = {i.name: np.int32 if i.type == "tensor(int32)" else np.int64 for i in self.session.get_inputs()}
+        self.output_name = self.session.get_outputs()[0].name
+        self.ms_per_token = None
+        self.lock = threading.Lock()
+        self.latency = deque(maxlen=1024)
+        self.calls = self.skipped = self.timeouts = 0
+
+    def _inputs(self, query, passages):
+        encodings = self.tokenizer.encode_batch([(query, p) for p in passages])
+        n = max(len(e.ids) for e in encodings)
+        ids = np.full((len(encodings), n), self.pad_id, dtype=np.int64)
+        mask, types = np.zeros_like(ids), np.zeros_like(ids)
+        for r, e in enumerate(encodings):
+            ids[r, :len(e.ids)], mask[r, :len(e.ids)], types[r, :len(e.ids)] = e.ids, 1, e.type_ids
+        arrays = {"input_ids": ids, "attention_mask": mask, "token_type_ids": types}
+        return {k: arrays[k].astype(t, copy=False) for k, t in self.input_types.items()}, ids.size
+
+    def scores(self, query, passages):
+        """Relevance logits for each passage, or None when the budget does not allow them."""
+        with self.lock:
+            self.calls += 1
+        inputs, tokens = self._inputs(query, passages)
+        with self.lock:
+            probe = self.ms_per_token is not None and self.ms_per_token * tokens > self.budget_ms
+            if probe:
+                self.skip_run += 1
+                if self.skip_run < self.probe_every:
+                    self.skipped += 1
+                    return None
+            self.skip_run = 0
+
+        run_options = ort.RunOptions()
+        deadline = threading.Timer(self.budget_ms / 1000, setattr, (run_options, "terminate", True))
+        deadline.start()
+        t0 = time.perf_counter()
+        try:
+            with tracer.span("cross_encode", n=len(passages), tokens=tokens):
+                logits = self.session.run([self.output_name], inputs, run_options)[0]
+        except Exception:
+            if not run_options.terminate:
+                raise
+            with self.lock:
+                self.timeouts += 1
+                # The run took at least this long, which is still a (lower-bound) rate sample
+                self._observe((time.perf_counter() - t0) * 1000, tokens, probe)
+            return None
+        finally:
+            deadline.cancel()
+        ms = (time.perf_counter() - t0) * 1000
+        with self.lock:
+            self.latency.append(ms)
+            self._observe(ms, tokens, probe)
+        return np.asarray(logits, dtype="float32").reshape(len(passages), -1)[:, -1]  # 2-class heads: "relevant" logit
+
+    def _observe(self, ms, tokens, probe=False):
+        # A probe ran against the estimate, so its measurement replaces it outright
+        rate = ms / tokens
+        self.ms_per_token = rate if self.ms_per_token is None or probe else 0.8 * self.ms_per_token + 0.2 * rate
+
+    def rerank(self, query, passages):
+        """Passage indices best first, or None to keep the incoming order."""
+        if len(passages) < 2:
+            return None
+        s = self.scores(query, passages)
+        return None if s is None else np.argsort(-s, kind="stable")
+
+    def stats(self):
+        with self.lock:
+            arr = np.array(self.latency)
+            return {"calls": self.calls, "skipped": self.skipped, "timeouts": self.timeouts, "budget_ms": self.budget_ms,
+                    "p50_ms": float(np.percentile(arr, 50)) if len(arr) else None,
+                    "p95_ms": float(np.percentile(arr, 95)) if len(arr) else None,
+                    "ms_per_token": self.ms_per_token}
@@ -0,0 +1,97 @@
+import re, threading, time
+from collections import OrderedDict
+import numpy as np
+
+def normalize_question(q):
+    return re.sub(r"\s+", " ", re.sub(r"[^\w\s]", " ", q.lower())).strip()
+
+def _unit(qvec):
+    q = np.asarray(qvec, dtype="float32").ravel()
+    return q / (np.linalg.norm(q) or 1.0)
+
+class AnswerCache:
+    """
+    Caches generated answers by (index version, retrieved chunk IDs, normalized question).
+    A question whose embedding is within `threshold` cosine similarity of a cached one
+    with the same retrieved chunks is treated as the same question. Entries expire after
+    `ttl` seconds, the least recently used go first, and an index version change clears all.
+    """
+
+    def __init__(self, max_entries=512, ttl=3600, threshold=0.95):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # key -> (answer, created, qvec)
+        self.version = None
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+
+    def key(self, version, chunk_ids, question):
+        return (version, tuple(int(i) for i in chunk_ids), normalize_question(question))
+
+    def _check_version(self, version):
+        if version != self.version:
+            self.entries.clear()
+            self.version = version
+
+    def get(self, version, chunk_ids, question, qvec=None):
+        key = self.key(version, chunk_ids, question)
+        now = time.time()
+        with self.lock:
+            self._check_version(version)
+            for k in [k for k, e in self.entries.items() if now - e[1] > self.ttl]:
+                del self.entries[k]
+
+            entry = self.entries.get(key)
+            near = False
+            if entry is None and qvec is not None:
+                q = _unit(qvec)
+                same_chunks = [k for k, e in self.entries.items() if k[1] == key[1] and e[2] is not None]
+                if same_chunks:
+                    sims = np.array([float(np.dot(q, self.entries[k][2])) for k in same_chunks])
+                    best = int(sims.argmax())
+                    if sims[best] >= self.threshold:
+                        key, entry, near = same_chunks[best], self.entries[same_chunks[best]], True
+
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.near_hits += near
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, version, chunk_ids, question, answer, qvec=None):
+        key = self.key(version, chunk_ids, question)
+        q = None if qvec is None else _unit(qvec)
+        with self.lock:
+            self._check_version(version)
+            self.entries[key] = (answer, time.time(), q)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def record(self, gen, version, chunk_ids, question, qvec=None):
+        """Passes a token stream through and caches the full answer if it completes."""
+        parts = []
+        for token in gen:
+            parts.append(token)
+            yield token
+        self.put(version, chunk_ids, question, "".join(parts), qvec)
+
+    async def arecord(self, agen, version, chunk_ids, question, qvec=None):
+        parts = []
+        async for token in agen:
+            parts.append(token)
+            yield token
+        self.put(version, chunk_ids, question, "".join(parts), qvec)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            return {"entries": len(self.entries), "hits": self.hits, "near_hits": self.near_hits, "misses": self.misses}
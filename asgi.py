@@ -0,0 +1,73 @@
+"""
+Async serving path for the remote engine: `uvicorn asgi:app`.
+
+/ask runs on the event loop with httpx streaming and bounded admission, so a
+slow generation holds a coroutine rather than a worker thread. Every other
+route is served by the Flask app in main.py.
+"""
+import asyncio
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.middleware.wsgi import WSGIMiddleware
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from typing import List, Optional
+from starlette.background import BackgroundTask
+
+import main
+from http_client import get_async_client
+from scheduler import AsyncAdmission, QueueFull
+
+app = FastAPI(title="EdgeRAG (async)")
+admission = AsyncAdmission(main.MAX_GENERATIONS, main.MAX_QUEUED)
+
+class QueryRequest(BaseModel):
+    question: str
+    doc_ids: Optional[List[str]] = None
+
+async def static_msg(msg):
+    for word in msg.split():
+        yield word + " "
+
+@app.post("/ask")
+async def ask(request: QueryRequest, http_request: Request):
+    # Only an existing session can have documents; new sessions start at /upload
+    sid = main.request_session_id(http_request.cookies, http_request.headers)
+    # A pool miss loads the session's index and chunk store from disk
+    engine = await asyncio.get_running_loop().run_in_executor(None, main.sessions.get, sid) if sid else None
+    if engine is None or not len(engine.store):
+        raise HTTPException(status_code=400, detail="No document")
+
+    q = request.question
+    qv, hits = await engine.asearch(q, doc_ids=request.doc_ids)
+    if not hits:
+        return StreamingResponse(static_msg("I couldn't find relevant information in the uploaded document to answer your question."), media_type="text/plain")
+
+    # Shared with the Flask routes, so both paths fill and invalidate one cache
+    ids, version, answers = [h["id"] for h in hits], engine.store.version, main.sessions.answers(sid)
+    cached = answers.get(version, ids, q, qv)
+    if cached is not None:
+        return StreamingResponse(iter([cached]), media_type="text/plain")
+
+    try:
+        slot = await admission.acquire(timeout=main.QUEUE_TIMEOUT_S)
+    except QueueFull:
+        raise HTTPException(status_code=503, detail={"error": "Server busy", **admission.stats()})
+
+    return StreamingResponse(
+        admission.stream(slot, answers.arecord(engine.astream_answer(q, hits), version, ids, q, qv)),
+        media_type="text/plain",
+        headers={"X-Queue-Depth": str(admission.queued)},
+        background=BackgroundTask(slot.release),
+    )
+
+@app.get("/queue")
+async def queue_stats():
+    return admission.stats()
+
+@app.get("/metrics")
+async def metrics():
+    # Same process-wide tracer as the Flask routes, with this app's admission and async client
+    return {**main.metrics(), "queue": admission.stats(), "http_async": get_async_client().stats()}
+
+app.mount("/", WSGIMiddleware(main.app))
@@ -0,0 +1,118 @@
+import json, mmap, os, shutil
+import numpy as np
+
+from sparse_index import SparseIndex, SparseIndexWriter
+
+def _fields(record):
+    # Chunker records carry "metadata"; "meta" (page only) is the older remote format
+    meta = record.get("metadata") or record.get("meta") or {}
+    page = meta.get("page", 0)
+    return page, meta.get("page_end", page), meta.get("section", "unknown"), meta.get("type", "text")
+
+class ChunkStoreWriter:
+    """
+    Appends chunks to a store directory:
+      text.bin      packed UTF-8 text
+      offsets.npy   int64 byte offsets, len = n + 1
+      page.npy      int32 first page of each chunk
+      page_end.npy  int32 last page (chunks may span a page break)
+      section.npy   uint8 codes into vocab.json["section"]
+      type.npy      uint8 codes into vocab.json["type"]
+      vectors.npy   float16 full-dimension embeddings (two-stage search only)
+    plus the BM25 postings of sparse_index.SparseIndexWriter.
+    Files appear under `path` only on close(), replacing any previous store.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.tmp = path + ".tmp"
+        shutil.rmtree(self.tmp, ignore_errors=True)
+        os.makedirs(self.tmp)
+        self.text = open(os.path.join(self.tmp, "text.bin"), "wb")
+        self.offsets = [0]
+        self.pages, self.page_ends, self.sections, self.types = [], [], [], []
+        self.vocab = {"section": {}, "type": {}}
+        self.sparse = SparseIndexWriter()
+        self.vectors = []
+
+    def _code(self, column, value):
+        return self.vocab[column].setdefault(value, len(self.vocab[column]))
+
+    def add(self, records, vecs=None):
+        if vecs is not None:
+            self.vectors.append(np.asarray(vecs, dtype=np.float16))
+        for r in records:
+            data = r["text"].encode("utf-8")
+            self.text.write(data)
+            self.offsets.append(self.offsets[-1] + len(data))
+            page, page_end, section, kind = _fields(r)
+            self.pages.append(page)
+            self.page_ends.append(page_end)
+            self.sections.append(self._code("section", section))
+            self.types.append(self._code("type", kind))
+            self.sparse.add(r["text"])
+
+    def __len__(self):
+        return len(self.pages)
+
+    def close(self):
+        self.text.close()
+        np.save(os.path.join(self.tmp, "offsets.npy"), np.array(self.offsets, dtype=np.int64))
+        np.save(os.path.join(self.tmp, "page.npy"), np.array(self.pages, dtype=np.int32))
+        np.save(os.path.join(self.tmp, "page_end.npy"), np.array(self.page_ends, dtype=np.int32))
+        np.save(os.path.join(self.tmp, "section.npy"), np.array(self.sections, dtype=np.uint8))
+        np.save(os.path.join(self.tmp, "type.npy"), np.array(self.types, dtype=np.uint8))
+        with open(os.path.join(self.tmp, "vocab.json"), "w") as f:
+            json.dump({col: list(codes) for col, codes in self.vocab.items()}, f)
+        self.sparse.write(self.tmp)
+        if self.vectors:
+            np.save(os.path.join(self.tmp, "vectors.npy"), np.vstack(self.vectors))
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.replace(self.tmp, self.path)
+        return len(self)
+
+    def abort(self):
+        """Discards everything written so far; any previous store at `path` is kept."""
+        self.text.close()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+def write_chunks(path, records, vecs=None):
+    writer = ChunkStoreWriter(path)
+    writer.add(records, vecs)
+    return writer.close()
+
+class ChunkStore:
+    """Memory-mapped reader; opening costs the same regardless of corpus size."""
+
+    def __init__(self, path):
+        self.path = path
+        load = lambda name: np.load(os.path.join(path, name), mmap_mode="r")
+        self.offsets, self.pages = load("offsets.npy"), load("page.npy")
+        self.sections, self.types = load("section.npy"), load("type.npy")
+        # Stores written before page-spanning chunks end every chunk on its first page
+        self.page_ends = load("page_end.npy") if os.path.exists(os.path.join(path, "page_end.npy")) else self.pages
+        with open(os.path.join(path, "vocab.json")) as f:
+            self.vocab = json.load(f)
+        with open(os.path.join(path, "text.bin"), "rb") as f:
+            self.text = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b""
+        # Stores written before hybrid retrieval have no postings and stay dense-only
+        self.sparse = SparseIndex(path) if SparseIndex.exists(path) else None
+        vec_path = os.path.join(path, "vectors.npy")
+        self.vectors = np.load(vec_path, mmap_mode="r") if os.path.exists(vec_path) else None
+
+    def __len__(self):
+        return len(self.pages)
+
+    def text_at(self, i):
+        return self.text[self.offsets[i]:self.offsets[i + 1]].decode("utf-8")
+
+    def __getitem__(self, i):
+        i = int(i)
+        return {"text": self.text_at(i),
+                "metadata": {"page": int(self.pages[i]), "page_end": int(self.page_ends[i]),
+                             "section": self.vocab["section"][self.sections[i]],
+                             "type": self.vocab["type"][self.types[i]]}}
+
+    def close(self):
+        if isinstance(self.text, mmap.mmap):
+            self.text.close()
@@ -0,0 +1,181 @@
+import bisect, hashlib, re
+
+# Chunk size in embedding-model tokens; no overlap, chunks end on sentence boundaries instead
+CHUNK_TOKENS = 200
+
+# Matched against a whole heading ("3 Results", "II. METHODS", "Abstract—We ...")
+SECTION_PATTERNS = {
+    "abstract": re.compile(r"abstract", re.I),
+    "introduction": re.compile(r"introduction", re.I),
+    "methods": re.compile(r"(materials and )?methods?|materials|methodology", re.I),
+    "results": re.compile(r"(experimental )?results?|experiments|evaluation", re.I),
+    "discussion": re.compile(r"discussion", re.I),
+    "conclusion": re.compile(r"conclusions?( and future work)?", re.I),
+}
+_HEADING = re.compile(r"(?:(?:[IVX]+|\d+(?:\.\d+)*)\.?\s+)?([A-Za-z][A-Za-z ]*?)\s*(?:[.:—–]|\s-|$)")
+_SENTENCE_END = re.compile(r"(?<=[.!?])[\"')\]]*\s+(?=[\"'(\[]?[A-Z0-9])")
+_ABBREV = re.compile(r"\b(?:fig|figs|eq|eqs|sec|tab|no|vs|al|e\.g|i\.e|cf|approx)\.$", re.I)
+_WORD = re.compile(r"\w+|[^\w\s]")
+
+def approx_tokens(texts):
+    """WordPiece-like token counts without a tokenizer: long words count as several pieces."""
+    return [sum(1 + (len(w) - 1) // 8 for w in _WORD.findall(t)) for t in texts]
+
+def detect_section(line, current_section):
+    """The section a heading line starts, or current_section for ordinary text."""
+    m = _HEADING.match(line)
+    if m:
+        for sec, pat in SECTION_PATTERNS.items():
+            if pat.fullmatch(m.group(1)):
+                return sec
+    return current_section
+
+def split_sentences(text):
+    """(start, end) offsets of the sentences in text."""
+    spans, start = [], 0
+    for m in _SENTENCE_END.finditer(text):
+        if not _ABBREV.search(text, start, m.start()):  # "Fig. 3" and "et al. Smith" are not sentence ends
+            spans.append((start, m.start()))
+            start = m.end()
+    return spans + [(start, len(text))]
+
+def _fingerprint(text, digits=True):
+    """Case- and spacing-insensitive; digits=False also ignores numbers (page numbers in running headers)."""
+    return re.sub(r"\s+" if digits else r"[\d\s]+", " ", text.lower()).strip()
+
+class Chunker:
+    """
+    Streaming chunker: feed pages in order with add_page(), then call finish().
+    Chunks hold whole sentences up to max_tokens (count_tokens(list_of_texts) -> counts),
+    break at section headings, and carry unfinished sentences across page breaks, so a
+    chunk records the page range it came from. Lines repeated at the top or bottom of
+    pages (running headers, footers, page numbers) and near-identical chunks are dropped.
+    """
+
+    def __init__(self, count_tokens=approx_tokens, max_tokens=CHUNK_TOKENS, section="unknown", kind="text",
+                 edge_lines=2):
+        self.count_tokens = count_tokens
+        self.max_tokens = max_tokens
+        self.section = section
+        self.kind = kind
+        self.edge_lines = edge_lines
+        self.edge_seen = {}          # fingerprint of a line at a page edge -> times seen
+        self.numbered_seen = {}      # the same, ignoring numbers ("Page 3 of 10" == "Page 4 of 10")
+        self.pages = 0
+        self.chunk_seen = set()
+        self.pending, self.marks = "", []   # unfinished text; (offset, page) where each page starts in it
+        self.sents, self.tokens = [], 0     # current chunk: (sentence, tokens, first page, last page)
+        self.dropped = 0
+
+    def add_page(self, page_no, text):
+        """Returns the chunks completed by this page."""
+        lines = [l for l in (l.strip() for l in text.splitlines()) if l]
+        out = []
+        for i, line in enumerate(lines):
+            if self._running_line(line, i, len(lines)):
+                continue
+            section = detect_section(line, self.section)
+            if section != self.section:
+                self._flush_pending(out, complete=True)
+                self._emit(out)
+                self.section = section
+            self._append(line, page_no)
+        self._flush_pending(out, complete=False)
+        self.pages += 1
+        return out
+
+    def finish(self):
+        out = []
+        self._flush_pending(out, complete=True)
+        self._emit(out)
+        return out
+
+    def _running_line(self, line, i, n):
+        if self.edge_lines <= i < n - self.edge_lines or len(line) > 100:
+            return False
+        if line.isdigit():
+            return True  # a page number; numbers inside the page are table cells
+        key, numbered = _fingerprint(line), _fingerprint(line, digits=False)
+        seen, numbered_seen = self.edge_seen.get(key, 0), self.numbered_seen.get(numbered, 0)
+        self.edge_seen[key] = seen + 1
+        self.numbered_seen[numbered] = numbered_seen + 1
+        if seen:
+            return True  # the same line on the edge of an earlier page
+        # Lines differing only in numbers are running headers only when most pages carry one;
+        # "Table 3: Results" after "Table 1: Results" is a new caption
+        return numbered_seen >= 2 and 2 * numbered_seen >= self.pages
+
+    def _append(self, line, page_no):
+        if self.pending.endswith("-") and line[:1].islower():
+            self.pending = self.pending[:-1]  # a word hyphenated across lines
+        elif self.pending:
+            self.pending += " "
+        if not self.marks or self.marks[-1][1] != page_no:
+            self.marks.append((len(self.pending), page_no))
+        self.pending += line
+
+    def _page_at(self, offset):
+        return self.marks[bisect.bisect_right([o for o, _ in self.marks], offset) - 1][1]
+
+    def _flush_pending(self, out, complete):
+        """
+        Moves finished sentences into chunks; unless complete, an unterminated last one stays
+        pending. Text without sentence punctuation (tables, OCR) is flushed anyway once the
+        pending part reaches about two chunks, so it cannot hold a whole document.
+        """
+        if not self.pending:
+            return
+        spans = split_sentences(self.pending)
+        keep = None
+        if (not complete and not self.pending.rstrip("\"')]").endswith((".", "!", "?"))
+                and len(self.pending) - spans[-1][0] < 8 * self.max_tokens):
+            keep = spans.pop()[0]
+        self._add_sentences(spans, out)
+        if keep is None:
+            self.pending, self.marks = "", []
+        else:
+            first = self._page_at(keep)
+            self.marks = [(0, first)] + [(o - keep, p) for o, p in self.marks if o > keep]
+            self.pending = self.pending[keep:]
+
+    def _add_sentences(self, spans, out):
+        """Adds the sentences at (start, end) offsets of pending, each with its own page range."""
+        if not spans:
+            return
+        for (s, e), n in zip(spans, self.count_tokens([self.pending[s:e] for s, e in spans])):
+            for ps, pe, m in self._fit(s, e, n):
+                if self.sents and self.tokens + m > self.max_tokens:
+                    self._emit(out)
+                self.sents.append((self.pending[ps:pe], m, self._page_at(ps), self._page_at(max(ps, pe - 1))))
+                self.tokens += m
+
+    def _fit(self, s, e, n):
+        """Splits a sentence longer than max_tokens (tables, run-on OCR text) on word boundaries."""
+        words = [m.span() for m in re.finditer(r"\S+", self.pending[s:e])]
+        if n <= self.max_tokens or len(words) < 2:
+            return [(s, e, n)]
+        left_end, right_start = s + words[len(words) // 2 - 1][1], s + words[len(words) // 2][0]
+        nl, nr = self.count_tokens([self.pending[s:left_end], self.pending[right_start:e]])
+        return self._fit(s, left_end, nl) + self._fit(right_start, e, nr)
+
+    def _emit(self, out):
+        if not self.sents:
+            return
+        text = " ".join(s[0] for s in self.sents)
+        first, last = self.sents[0][2], max(s[3] for s in self.sents)
+        self.sents, self.tokens = [], 0
+        key = hashlib.blake2b(_fingerprint(text).encode("utf-8"), digest_size=16).digest()
+        if key in self.chunk_seen:
+            self.dropped += 1
+            return
+        self.chunk_seen.add(key)
+        out.append({"text": text, "metadata": {"page": first, "page_end": last,
+                                               "section": self.section, "type": self.kind}})
+
+def chunk_pages(pages, **kwargs):
+    """All chunks of an iterable of (page_no, text)."""
+    chunker = Chunker(**kwargs)
+    out = []
+    for page_no, text in pages:
+        out += chunker.add_page(page_no, text)
+    return out + chunker.finish()
@@ -0,0 +1,302 @@
+import bisect, json, os, shutil, threading, uuid
+import faiss
+import numpy as np
+
+from chunk_store import ChunkStore, ChunkStoreWriter
+from index_factory import (DEFAULTS, ENCODING, ENCODINGS, apply_search_params, encode, load_index, load_params,
+                           needs_rerank, new_index, read_any, unit_range, write_any)
+from matryoshka import CANDIDATES, COARSE_DIM, coarse, rerank, shortlist
+from sparse_index import bm25_search
+from tracing import tracer
+
+class IndexFiles:
+    """Read-only single-document store over a standalone faiss.index + chunk store pair."""
+
+    def __init__(self, index_path, chunks_path, candidates=CANDIDATES):
+        self.index = load_index(index_path)
+        self.chunks = ChunkStore(chunks_path)
+        params = load_params(index_path)
+        self.coarse_dim = params.get("coarse_dim", 0)
+        self.encoding = params.get("encoding", "float")
+        self.candidates = candidates
+        self.dim = params.get("dim", self.index.d)
+        self.version = f"{os.path.abspath(index_path)}@{os.stat(index_path).st_mtime_ns}"
+
+    def __len__(self):
+        return self.index.ntotal
+
+    def search(self, qvecs, k, doc_ids=None):
+        with tracer.span("faiss_search"):
+            if not needs_rerank(self.coarse_dim, self.encoding):
+                return self.index.search(qvecs, k)
+            q = coarse(qvecs, self.coarse_dim) if self.coarse_dim else qvecs
+            _, cand = self.index.search(encode(q, self.encoding), shortlist(k, self.candidates, self.encoding))
+        with tracer.span("rerank"):
+            return rerank(qvecs, cand, lambda ids: self.chunks.vectors[ids], k)
+
+    def sparse_search(self, query, k, doc_ids=None):
+        with tracer.span("bm25_search"):
+            return bm25_search([(self.chunks.sparse, 0)] if self.chunks.sparse else [], query, k)
+
+    def chunk(self, chunk_id):
+        with tracer.span("metadata"):
+            return self.chunks[chunk_id]
+
+    def vectors(self, ids):
+        """Full vectors of chunk IDs, or None when neither the store nor the index keeps them."""
+        ids = np.asarray(ids, dtype="int64")
+        if self.chunks.vectors is not None:
+            return np.asarray(self.chunks.vectors[ids], dtype="float32")
+        if isinstance(self.index, faiss.IndexBinary):
+            return None
+        try:
+            return self.index.reconstruct_batch(ids)
+        except RuntimeError:  # IVF-PQ keeps no direct map
+            return None
+
+class DocumentWriter:
+    """
+    Streams one document into a Collection: chunk text goes straight to its chunk
+    store, vectors are held until commit(). Nothing is searchable before commit().
+    """
+
+    def __init__(self, collection, name):
+        self.collection = collection
+        self.name = name
+        self.doc_id = uuid.uuid4().hex[:12]
+        self.chunks = ChunkStoreWriter(collection._file("docs", self.doc_id))
+        self.vecs = []
+
+    def add(self, records, vecs):
+        # Two-stage collections keep full vectors beside the text for reranking
+        self.chunks.add(records, vecs if self.collection.rerank else None)
+        self.vecs.append(np.asarray(vecs, dtype="float32"))
+
+    def commit(self):
+        count = self.chunks.close()
+        vecs = np.vstack(self.vecs) if self.vecs else np.zeros((0, self.collection.dim), dtype="float32")
+        return self.collection._register(self.doc_id, self.name, count, vecs)
+
+    def abort(self):
+        self.chunks.abort()
+
+class Collection:
+    """
+    Persistent multi-document index. Each document owns a contiguous ID range in an
+    IndexIDMap2 and its own metadata file, so adding or deleting a document never
+    re-embeds the others.
+
+    Layout:  <path>/index.faiss, <path>/manifest.json, <path>/docs/<doc_id>/ (chunk store)
+
+    With coarse_dim set, the index holds only that Matryoshka prefix; with encoding
+    "int8" or "binary" it holds scalar-quantised or sign-bit codes. Coarse and binary
+    searches take `candidates` hits and rerank them with the full vectors in the chunk
+    stores. An int8 index quantises over the fixed range of unit vectors, [-1, 1].
+    """
+
+    def __init__(self, path, dim, kind="flat", coarse_dim=COARSE_DIM, candidates=CANDIDATES,
+                 encoding=ENCODING, **params):
+        if kind not in ("flat", "hnsw"):
+            raise ValueError(f"Collections support incremental 'flat' or 'hnsw' indexes, not '{kind}'")
+        if encoding not in ENCODINGS:
+            raise ValueError(f"Unknown encoding '{encoding}', expected one of {list(ENCODINGS)}")
+        if encoding == "binary" and (coarse_dim or dim) % 8:
+            raise ValueError("Binary codes need a dimension that is a multiple of 8")
+        if encoding == "binary" and kind == "hnsw":
+            # faiss binary HNSW cannot filter by document; a flat Hamming scan is fast anyway
+            raise ValueError("Binary collections use a flat index")
+        self.path = path
+        self.dim = dim
+        self.candidates = candidates
+        self.lock = threading.RLock()
+        self.doc_stores = {}
+        os.makedirs(os.path.join(path, "docs"), exist_ok=True)
+
+        if os.path.exists(self._file("manifest.json")):
+            with open(self._file("manifest.json")) as f:
+                self.manifest = json.load(f)
+            self.index = read_any(self._file("index.faiss"), self.encoding)
+        else:
+            self.manifest = {"dim": dim, "kind": kind, "params": {**DEFAULTS[kind], **params}, "next_id": 0, "docs": {},
+                             "coarse_dim": coarse_dim if coarse_dim and coarse_dim < dim else 0, "encoding": encoding}
+            self.index = self._new_index()
+            self._save()
+        apply_search_params(self.index.index, self.manifest["params"])
+        self._reindex_ranges()
+
+    @property
+    def coarse_dim(self):
+        return self.manifest.get("coarse_dim", 0)
+
+    @property
+    def encoding(self):
+        return self.manifest.get("encoding", "float")
+
+    @property
+    def rerank(self):
+        return needs_rerank(self.coarse_dim, self.encoding)
+
+    def _file(self, *parts):
+        return os.path.join(self.path, *parts)
+
+    def _new_index(self):
+        params = self.manifest["params"]
+        base = new_index(self.manifest["kind"], self.coarse_dim or self.dim, params, self.encoding)
+        if self.encoding == "int8":
+            unit_range(base)
+        apply_search_params(base, params)
+        return faiss.IndexBinaryIDMap2(base) if self.encoding == "binary" else faiss.IndexIDMap2(base)
+
+    def _add(self, codes, ids):
+        """Adds vectors already in index space (coarse prefix, sign bits)."""
+        if not self.index.is_trained:
+            # Empty int8 collections saved before the range was fixed
+            unit_range(self.index.index)
+            self.index.is_trained = True
+        with tracer.span("faiss_add", n=len(codes)):
+            self.index.add_with_ids(codes, ids)
+
+    def _reindex_ranges(self):
+        docs = sorted(self.manifest["docs"].items(), key=lambda kv: kv[1]["start"])
+        self.range_starts = [d["start"] for _, d in docs]
+        self.range_docs = [doc_id for doc_id, _ in docs]
+
+    def _save(self):
+        # Each file is swapped in whole, index first, so the manifest never names missing IDs
+        self.manifest["generation"] = uuid.uuid4().hex[:12]
+        tmp = self._file("index.faiss.tmp")
+        write_any(self.index, tmp)
+        os.replace(tmp, self._file("index.faiss"))
+        with open(self._file("manifest.json.tmp"), "w") as f:
+            json.dump(self.manifest, f)
+        os.replace(self._file("manifest.json.tmp"), self._file("manifest.json"))
+
+    @property
+    def version(self):
+        """Changes whenever documents are added or removed (even after a clear)."""
+        return self.manifest["generation"]
+
+    def writer(self, name):
+        return DocumentWriter(self, name)
+
+    def add_document(self, name, records, vecs):
+        writer = self.writer(name)
+        writer.add(records, vecs)
+        return writer.commit()
+
+    def _register(self, doc_id, name, count, vecs):
+        with self.lock:
+            start = self.manifest["next_id"]
+            if count:
+                if self.coarse_dim:
+                    vecs = coarse(vecs, self.coarse_dim)
+                self._add(encode(vecs, self.encoding), np.arange(start, start + count, dtype="int64"))
+            self.manifest["next_id"] = start + count
+            self.manifest["docs"][doc_id] = {"name": name, "start": start, "count": count}
+            self._reindex_ranges()
+            self._save()
+            return doc_id
+
+    def _close_store(self, doc_id):
+        store = self.doc_stores.pop(doc_id, None)
+        if store is not None:
+            store.close()
+
+    def delete_document(self, doc_id):
+        with self.lock:
+            doc = self.manifest["docs"].pop(doc_id)
+            ids = np.arange(doc["start"], doc["start"] + doc["count"], dtype="int64")
+            try:
+                self.index.remove_ids(faiss.IDSelectorBatch(ids))
+            except RuntimeError:
+                # HNSW cannot remove in place; rebuild from the stored vectors of the survivors
+                keep = np.setdiff1d(faiss.vector_to_array(self.index.id_map), ids)
+                vecs = None
+                if len(keep) and self.rerank:
+                    # Binary codes cannot be reconstructed; the chunk stores hold the full vectors
+                    full = self._vectors(keep)
+                    vecs = encode(coarse(full, self.coarse_dim) if self.coarse_dim else full, self.encoding)
+                elif len(keep):
+                    vecs = self.index.reconstruct_batch(keep)
+                self.index = self._new_index()
+                if vecs is not None:
+                    self._add(vecs, keep)
+            self._close_store(doc_id)
+            self._reindex_ranges()
+            self._save()
+            shutil.rmtree(self._file("docs", doc_id), ignore_errors=True)
+
+    def clear(self):
+        with self.lock:
+            for doc_id in list(self.doc_stores):
+                self._close_store(doc_id)
+            shutil.rmtree(self._file("docs"), ignore_errors=True)
+            os.makedirs(self._file("docs"))
+            self.manifest.update(next_id=0, docs={})
+            self.index = self._new_index()
+            self._reindex_ranges()
+            self._save()
+
+    def documents(self):
+        with self.lock:
+            return {doc_id: dict(d) for doc_id, d in self.manifest["docs"].items()}
+
+    def __len__(self):
+        return self.index.ntotal
+
+    def search(self, qvecs, k, doc_ids=None):
+        """Top-k search, optionally restricted to the ID ranges of `doc_ids`."""
+        with self.lock:
+            params = None
+            if doc_ids is not None:
+                docs = [self.manifest["docs"][d] for d in doc_ids if d in self.manifest["docs"]]
+                if not docs:
+                    return np.full((len(qvecs), k), -np.inf, dtype="float32"), np.full((len(qvecs), k), -1, dtype="int64")
+                ids = np.concatenate([np.arange(d["start"], d["start"] + d["count"], dtype="int64") for d in docs])
+                params = faiss.SearchParameters(sel=faiss.IDSelectorBatch(ids))
+            with tracer.span("faiss_search"):
+                if not self.rerank:
+                    return self.index.search(qvecs, k, params=params)
+                q = coarse(qvecs, self.coarse_dim) if self.coarse_dim else qvecs
+                _, cand = self.index.search(encode(q, self.encoding), shortlist(k, self.candidates, self.encoding), params=params)
+            with tracer.span("rerank"):
+                return rerank(qvecs, cand, self._vectors, k)
+
+    def _vectors(self, ids):
+        """Full stored vectors for chunk IDs, gathered from their documents' stores."""
+        out = np.empty((len(ids), self.dim), dtype="float32")
+        pos = np.searchsorted(self.range_starts, ids, side="right") - 1
+        for p in np.unique(pos):
+            doc_id = self.range_docs[p]
+            rows = pos == p
+            out[rows] = self._store(doc_id).vectors[ids[rows] - self.manifest["docs"][doc_id]["start"]]
+        return out
+
+    def vectors(self, ids):
+        """Full vectors of chunk IDs: stored ones for two-stage collections, else read back from the index."""
+        ids = np.asarray(ids, dtype="int64")
+        with self.lock:
+            return self._vectors(ids) if self.rerank else self.index.reconstruct_batch(ids)
+
+    def sparse_search(self, query, k, doc_ids=None):
+        """BM25 top-k over the documents' postings, scored as one corpus."""
+        with self.lock, tracer.span("bm25_search"):
+            docs = self.manifest["docs"] if doc_ids is None else {d: self.manifest["docs"][d] for d in doc_ids if d in self.manifest["docs"]}
+            parts = [(self._store(doc_id).sparse, doc["start"]) for doc_id, doc in docs.items() if doc["count"]]
+            return bm25_search([p for p in parts if p[0] is not None], query, k)
+
+    def _store(self, doc_id):
+        if doc_id not in self.doc_stores:
+            self.doc_stores[doc_id] = ChunkStore(self._file("docs", doc_id))
+        return self.doc_stores[doc_id]
+
+    def _doc_for(self, chunk_id):
+        pos = bisect.bisect_right(self.range_starts, chunk_id) - 1
+        doc_id = self.range_docs[pos]
+        return doc_id, self.manifest["docs"][doc_id]
+
+    def chunk(self, chunk_id):
+        with self.lock, tracer.span("metadata"):
+            doc_id, doc = self._doc_for(int(chunk_id))
+            record = self._store(doc_id)[int(chunk_id) - doc["start"]]
+            return {**record, "doc_id": doc_id}
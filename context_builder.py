@@ -0,0 +1,125 @@
+import os, re
+import numpy as np
+
+from chunker import split_sentences
+from tracing import tracer
+
+# Prompt tokens spent on retrieved context; every one is prefilled before the first answer token
+CONTEXT_TOKENS = int(os.environ.get("EDGERAG_CONTEXT_TOKENS", 1024))
+MMR_LAMBDA = 0.7       # relevance vs. novelty when choosing what goes into the budget
+DUPLICATE_SIM = 0.92   # a passage this similar to one already packed adds nothing
+MIN_OVERLAP = 20       # chars; shorter suffix/prefix matches between neighbours are coincidence
+MIN_PIECE_TOKENS = 32  # a passage cut shorter than this to fit the budget is left out
+SEPARATOR = "\n\n"
+_WORD = re.compile(r"\w+")
+
+def passage(store, chunk_id, score):
+    """A retrieval hit carrying the position fields that context packing merges on."""
+    record = store.chunk(chunk_id)
+    meta = record.get("metadata") or {}
+    page = meta.get("page", 0)
+    return {"id": int(chunk_id), "text": record["text"], "score": score, "doc_id": record.get("doc_id"),
+            "page": page, "page_end": meta.get("page_end", page), "type": meta.get("type", "text")}
+
+def _adjacent(a, b):
+    """b directly follows a in the same document, on the page where a ends or the next one."""
+    return (b["id"] == a["id"] + 1 and b.get("doc_id") == a.get("doc_id") and b.get("type") == a.get("type")
+            and 0 <= b.get("page", 0) - a.get("page_end", a.get("page", 0)) <= 1)
+
+def join_overlapping(a, b, max_chars=400):
+    """a + b with the longest suffix of a that starts b (overlapping windows) written once."""
+    for k in range(min(len(a), len(b), max_chars), MIN_OVERLAP - 1, -1):
+        if a.endswith(b[:k]):
+            return a + b[k:]
+    return f"{a} {b}"
+
+def _similarity(vecs, texts):
+    """Pairwise cosine of the passage vectors, or word-set Jaccard when there are none."""
+    if vecs is not None:
+        v = vecs / np.maximum(np.linalg.norm(vecs, axis=1, keepdims=True), 1e-12)
+        return v @ v.T
+    words = [set(_WORD.findall(t.lower())) for t in texts]
+    return np.array([[len(a & b) / max(len(a | b), 1) for b in words] for a in words], dtype="float32")
+
+class ContextBuilder:
+    """
+    Turns retrieved hits (best first) into the context passages of one prompt:
+    neighbouring chunks of the same document are merged into one passage, passages are
+    picked by MMR (incoming rank for relevance, vector similarity for redundancy) with
+    near-duplicates dropped, and they are packed into `budget` tokens as counted by
+    `count_tokens(list_of_texts) -> counts`, the generating model's tokenizer. A passage
+    that does not fit is cut to its leading sentences. Passages come back in chunk-ID
+    order, so the same selection always yields the same prompt prefix.
+    """
+
+    def __init__(self, count_tokens, budget=CONTEXT_TOKENS, mmr_lambda=MMR_LAMBDA, duplicate_sim=DUPLICATE_SIM):
+        self.count_tokens = count_tokens
+        self.budget = budget
+        self.mmr_lambda = mmr_lambda
+        self.duplicate_sim = duplicate_sim
+        self.separator_tokens = count_tokens([SEPARATOR])[0]
+
+    def _merge(self, hits):
+        """Runs of adjacent hits as passages: text, best rank, member hit indices, first chunk ID."""
+        units = []
+        for j in sorted(range(len(hits)), key=lambda j: hits[j]["id"]):
+            h = hits[j]
+            if units and _adjacent(hits[units[-1]["members"][-1]], h):
+                u = units[-1]
+                u["text"], u["rank"] = join_overlapping(u["text"], h["text"]), min(u["rank"], j)
+                u["members"].append(j)
+            else:
+                units.append({"text": h["text"], "rank": j, "members": [j], "id": h["id"]})
+        return units
+
+    def _cut(self, text, limit):
+        """The leading sentences of text that fit in limit tokens, or None if too little fits."""
+        spans = split_sentences(text)
+        counts = np.cumsum(self.count_tokens([text[s:e] for s, e in spans]))
+        n = int(np.searchsorted(counts, limit, side="right"))
+        if not n or counts[n - 1] < MIN_PIECE_TOKENS:
+            return None, 0
+        return text[spans[0][0]:spans[n - 1][1]], int(counts[n - 1])
+
+    def build(self, hits, vectors=None, budget=None):
+        """Context passages for hits (ordered best first); vectors are the hits' embeddings, if known."""
+        budget = self.budget if budget is None else budget
+        stats = {"hits": len(hits), "merged": 0, "duplicates": 0, "truncated": 0, "skipped": 0, "tokens": 0}
+        if not hits:
+            return [], stats
+        units = self._merge(hits)
+        stats["merged"] = len(hits) - len(units)
+        # Passage redundancy is that of their most similar member chunks
+        hit_sim = _similarity(None if vectors is None else np.asarray(vectors, dtype="float32"), [h["text"] for h in hits])
+        sim = np.array([[hit_sim[np.ix_(a["members"], b["members"])].max() for b in units] for a in units])
+        relevance = 1 - np.array([u["rank"] for u in units], dtype="float32") / len(hits)
+        tokens = self.count_tokens([u["text"] for u in units])
+
+        remaining, chosen, picked = budget, [], []
+        candidates = list(range(len(units)))
+        while candidates and remaining > self.separator_tokens:
+            redundancy = sim[np.ix_(candidates, picked)].max(axis=1) if picked else np.zeros(len(candidates))
+            best = int(np.argmax(self.mmr_lambda * relevance[candidates] - (1 - self.mmr_lambda) * redundancy))
+            u, red = candidates.pop(best), redundancy[best]
+            if red >= self.duplicate_sim:
+                stats["duplicates"] += len(units[u]["members"])
+                continue
+            text, n = units[u]["text"], tokens[u]
+            cost = n + (self.separator_tokens if chosen else 0)
+            if cost > remaining:
+                text, n = self._cut(text, remaining - (cost - tokens[u]))
+                if text is None:
+                    stats["skipped"] += len(units[u]["members"])
+                    continue
+                stats["truncated"] += 1
+                cost = n + (self.separator_tokens if chosen else 0)
+            remaining -= cost
+            picked.append(u)
+            chosen.append((units[u]["id"], text))
+        stats["skipped"] += sum(len(units[u]["members"]) for u in candidates)
+        stats["tokens"] = budget - remaining
+        tracer.value("context_tokens", stats["tokens"], **{k: v for k, v in stats.items() if k != "tokens"})
+        return [text for _, text in sorted(chosen)], stats
+
+    def context(self, hits, vectors=None, budget=None):
+        return SEPARATOR.join(self.build(hits, vectors, budget)[0])
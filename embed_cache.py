@@ -0,0 +1,175 @@
+import atexit, hashlib, os, re, tempfile, threading, unicodedata
+from contextlib import contextmanager
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: rows are still checked against their keys, just not serialised between processes
+    fcntl = None
+
+CACHE_DIR = os.environ.get("EDGERAG_CACHE_DIR", os.path.join(tempfile.gettempdir(), "edgerag_cache"))
+KEY_BYTES = 16
+
+def normalize_text(text):
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text)).strip()
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding cache: a memory-mapped (capacity, dim) float32 file with
+    a parallel mapped file of 16-byte keys, plus a last-used index. Every hit is checked
+    against the key stored beside its vector, so a slot rewritten by another process (or
+    before a crash lost the index) reads as a miss. Worker processes sharing the directory
+    serialise row writes with an exclusive lock on a lock file. Full caches evict
+    least-recently-used slots.
+    """
+
+    def __init__(self, cache_dir, model_id, dim, capacity=100_000, flush_every=256):
+        self.model_id = model_id
+        self.dim = dim
+        self.capacity = capacity
+        self.flush_every = flush_every
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.dirty = 0
+
+        os.makedirs(cache_dir, exist_ok=True)
+        stem = os.path.join(cache_dir, hashlib.blake2b(model_id.encode(), digest_size=6).hexdigest() + f"-{dim}")
+        self.vec_path, self.keys_path, self.ticks_path = stem + ".f32", stem + ".keys", stem + ".ticks.npy"
+        self.lock_file = open(stem + ".lock", "a+b")
+
+        with self._file_lock():
+            fresh = not (os.path.exists(self.vec_path) and os.path.exists(self.keys_path)
+                         and os.path.getsize(self.vec_path) == capacity * dim * 4
+                         and os.path.getsize(self.keys_path) == capacity * KEY_BYTES)
+            mode = "w+" if fresh else "r+"
+            self.vecs = np.memmap(self.vec_path, dtype="float32", mode=mode, shape=(capacity, dim))
+            self.keys = np.memmap(self.keys_path, dtype=np.uint8, mode=mode, shape=(capacity, KEY_BYTES))  # all-zero = empty
+        ticks = None if fresh or not os.path.exists(self.ticks_path) else np.load(self.ticks_path)
+        self.ticks = ticks if ticks is not None and len(ticks) == capacity else np.zeros(capacity, dtype=np.int64)
+        # The mapped keys are authoritative; the tick index only orders eviction and may be stale
+        used = np.flatnonzero(self.keys.any(axis=1))
+        self.ticks[used] = np.maximum(self.ticks[used], 1)
+        self.ticks[np.setdiff1d(np.arange(capacity), used)] = 0
+        self.slots = {self.keys[i].tobytes(): int(i) for i in used}
+        self.clock = int(self.ticks.max())
+
+    @contextmanager
+    def _file_lock(self, shared=False):
+        if fcntl is None:
+            yield
+            return
+        fcntl.flock(self.lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+
+    def key(self, text):
+        payload = f"{self.model_id}\0{self.dim}\0{normalize_text(text)}".encode("utf-8")
+        return hashlib.blake2b(payload, digest_size=KEY_BYTES).digest()
+
+    def embed(self, texts, embed_fn):
+        """Returns vectors for texts, calling embed_fn only on (deduplicated) cache misses."""
+        out, pending = self._lookup(texts)
+        if pending:
+            self._fill(out, pending, embed_fn([texts[idx[0]] for idx in pending.values()]))
+        return out
+
+    async def aembed(self, texts, embed_fn):
+        """embed() for an async embed_fn."""
+        out, pending = self._lookup(texts)
+        if pending:
+            self._fill(out, pending, await embed_fn([texts[idx[0]] for idx in pending.values()]))
+        return out
+
+    def _lookup(self, texts):
+        out = np.empty((len(texts), self.dim), dtype="float32")
+        pending = {}
+        with self.lock, self._file_lock(shared=True):
+            for i, t in enumerate(texts):
+                k = self.key(t)
+                slot = self.slots.get(k)
+                if slot is not None and self.keys[slot].tobytes() != k:
+                    del self.slots[k]  # another process reused the slot
+                    slot = None
+                if slot is None:
+                    pending.setdefault(k, []).append(i)
+                else:
+                    out[i] = self.vecs[slot]
+                    self._touch(slot)
+            self.hits += len(texts) - sum(len(v) for v in pending.values())
+            self.misses += len(pending)
+        return out, pending
+
+    def _fill(self, out, pending, vecs):
+        vecs = np.asarray(vecs, dtype="float32")
+        for idx, v in zip(pending.values(), vecs):
+            out[idx] = v
+        self.put(list(pending), vecs)
+
+    def _touch(self, slot):
+        self.clock += 1
+        self.ticks[slot] = self.clock
+
+    def put(self, keys, vecs):
+        keys, vecs = keys[-self.capacity:], vecs[-self.capacity:]
+        with self.lock, self._file_lock():
+            new = [k for k in keys if k not in self.slots]
+            free = np.flatnonzero(self.ticks == 0)[:len(new)]
+            if len(free) < len(new):
+                used = np.flatnonzero(self.ticks)
+                used = used[~np.isin(used, [self.slots[k] for k in keys if k in self.slots])]
+                lru = used[np.argsort(self.ticks[used])[:len(new) - len(free)]]
+                for slot in lru:
+                    self.slots.pop(self.keys[slot].tobytes(), None)
+                free = np.concatenate([free, lru])
+
+            for k, v in zip(keys, vecs):
+                slot = self.slots.get(k)
+                if slot is None:
+                    slot, free = int(free[0]), free[1:]
+                    self.slots[k] = slot
+                # Key cleared while the vector changes, so a reader never pairs a key with another vector
+                self.keys[slot] = 0
+                self.vecs[slot] = v
+                self.keys[slot] = np.frombuffer(k, dtype=np.uint8)
+                self._touch(slot)
+
+            self.dirty += len(keys)
+            if self.dirty >= self.flush_every:
+                self._flush()
+
+    def _flush(self):
+        self.vecs.flush()
+        self.keys.flush()
+        tmp = f"{self.ticks_path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            np.save(f, self.ticks)
+        os.replace(tmp, self.ticks_path)
+        self.dirty = 0
+
+    def flush(self):
+        with self.lock:
+            if self.dirty:
+                self._flush()
+
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self.slots), "capacity": self.capacity}
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+def get_cache(model_id, dim, cache_dir=CACHE_DIR, **kwargs):
+    """One EmbeddingCache per (dir, model, dim) per process, shared by ingest and query paths."""
+    key = (os.path.abspath(cache_dir), model_id, dim)
+    with _caches_lock:
+        if key not in _caches:
+            _caches[key] = EmbeddingCache(cache_dir, model_id, dim, **kwargs)
+        return _caches[key]
+
+@atexit.register
+def _flush_all():
+    for cache in list(_caches.values()):
+        cache.flush()
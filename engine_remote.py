@@ -1,32 +1,63 @@
-import faiss, json, requests, numpy as np
+import asyncio
 
-EMBED_URL = "https://abhinavdread-bge-en-ft-optimised.hf.space/embed"
-GEN_URL   = "https://abhinavdread-qwen-1-5b-q4-k-m.hf.space/generate"
+from http_client import get_async_client, get_client
+from embed_cache import get_cache
+from chunker import approx_tokens
+from collection import IndexFiles
+from context_builder import CONTEXT_TOKENS, ContextBuilder, passage
+from sparse_index import HYBRID, rrf
+from tracing import tracer
 
 class RAGEngine:
-    def __init__(self, index_path, meta_path):
-        self.index = faiss.read_index(index_path)
-        self.meta = json.load(open(meta_path))
+    def __init__(self, index_path=None, meta_path=None, client=None, use_cache=True, store=None, async_client=None,
+                 hybrid=HYBRID, context_tokens=CONTEXT_TOKENS):
+        # store: a Collection, or by default the standalone index/meta files
+        self.store = store if store is not None else IndexFiles(index_path, meta_path)
+        self.client = client or get_client()
+        self._async_client = async_client
+        self.hybrid = hybrid
+        self.cache = get_cache(self.client.embed_url, self.store.dim) if use_cache else None
+        # The hosted model's tokenizer is not available here; the word-piece estimate stands in
+        self.context = ContextBuilder(approx_tokens, context_tokens)
 
     def embed_query(self, q):
-        r = requests.post(EMBED_URL, json={"chunks": [q]}, timeout=30)
-        return np.array(r.json()["embeddings"], dtype="float32")
+        def embed_fn(t):
+            with tracer.span("embed_remote", n=len(t)):
+                return self.client.embed(t, timeout=30)
+        if self.cache is None:
+            return embed_fn([q])
+        return self.cache.embed([q], embed_fn)
 
-    def retrieve(self, query, k=4):
+    def retrieve(self, query, k=4, doc_ids=None):
+        return [h["text"] for h in self.search(query, k, doc_ids)[1]]
+
+    def search(self, query, k=4, doc_ids=None):
+        """Returns (query vector, hits) where hits are {"id", "text", "score"} dicts."""
         qv = self.embed_query(query)
-        scores, ids = self.index.search(qv, 15)
+        return qv, self._select(query, qv, k, doc_ids)
+
+    def _select(self, query, qv, k, doc_ids):
+        scores, ids = self.store.search(qv, 15, doc_ids)
+        ranked = [(int(i), float(s)) for s, i in zip(scores[0], ids[0]) if i != -1 and s >= 0.4]
+
+        if self.hybrid and ranked:
+            # Exact terms (acronyms, equation/table IDs) that the dense pass misses come in via BM25.
+            # It only joins a query with at least one dense hit over the floor: a stray term match
+            # anywhere in the corpus must not send an off-topic question to the LLM.
+            _, sparse = self.store.sparse_search(query, 15, doc_ids)
+            fused, fused_scores = rrf([[i for i, _ in ranked], sparse[0]], k)
+            ranked = list(zip(fused.tolist(), fused_scores.tolist()))
 
-        chunks = []
-        for s, i in zip(scores[0], ids[0]):
-            if i == -1: continue
-            if s < 0.4: continue
-            chunks.append(self.meta[str(i)]["text"])
+        return [passage(self.store, i, s) for i, s in ranked[:k]]
 
-        return chunks[:k]
+    def build_prompt(self, question, hits):
+        """The prompt for search hits (best first), their context packed into the token budget."""
+        with tracer.span("prompt_build"):
+            vectors = self.store.vectors([h["id"] for h in hits]) if hits else None
+            return self._prompt(self.context.context(hits, vectors), question)
 
-    def stream_answer(self, question, chunks):
-        context = "\n\n".join(chunks)
-        prompt = f"""<|im_start|>system
+    def _prompt(self, context, question):
+        return f"""<|im_start|>system
 Use ONLY the context.
 <|im_end|>
 <|im_start|>user
@@ -39,12 +70,35 @@ Question:
 <|im_start|>assistant
 """
 
-        with requests.post(
-            GEN_URL,
-            json={"prompt": prompt},
-            stream=True,
-            timeout=300
-        ) as r:
-            for chunk in r.iter_content(chunk_size=None):
-                if chunk:
-                    yield chunk.decode("utf-8")
+    def stream_answer(self, question, hits):
+        prompt = self.build_prompt(question, hits)
+        yield from tracer.stream(self.client.generate(prompt, timeout=300))
+
+    # asyncio variants for event-loop servers (asgi.py)
+
+    @property
+    def async_client(self):
+        if self._async_client is None:
+            self._async_client = get_async_client()
+        return self._async_client
+
+    async def aembed_query(self, q):
+        async def embed_fn(t):
+            with tracer.span("embed_remote", n=len(t)):
+                return await self.async_client.embed(t, timeout=30)
+        if self.cache is None:
+            return await embed_fn([q])
+        return await self.cache.aembed([q], embed_fn)
+
+    async def aretrieve(self, query, k=4, doc_ids=None):
+        return [h["text"] for h in (await self.asearch(query, k, doc_ids))[1]]
+
+    async def asearch(self, query, k=4, doc_ids=None):
+        qv = await self.aembed_query(query)
+        # FAISS releases the GIL, so the search itself runs off the event loop
+        return qv, await asyncio.to_thread(self._select, query, qv, k, doc_ids)
+
+    async def astream_answer(self, question, hits):
+        prompt = self.build_prompt(question, hits)
+        async for text in tracer.astream(self.async_client.generate(prompt, timeout=300)):
+            yield text
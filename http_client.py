@@ -0,0 +1,154 @@
+import asyncio, codecs, threading, time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+EMBED_URL = "https://abhinavdread-bge-en-ft-optimised.hf.space/embed"
+GEN_URL   = "https://abhinavdread-qwen-1-5b-q4-k-m.hf.space/generate"
+
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+class _Timed:
+    def _init_timing(self):
+        self.lock = threading.Lock()
+        self.latency = defaultdict(lambda: deque(maxlen=1024))
+
+    def _record(self, name, seconds):
+        with self.lock:
+            self.latency[name].append(seconds)
+
+    def stats(self):
+        with self.lock:
+            out = {}
+            for name, xs in self.latency.items():
+                arr = np.array(xs) * 1000
+                out[name] = {"calls": len(arr), "mean_ms": float(arr.mean()),
+                             "p50_ms": float(np.percentile(arr, 50)),
+                             "p95_ms": float(np.percentile(arr, 95))}
+            return out
+
+class RemoteClient(_Timed):
+    """Keep-alive session for the embed/generate endpoints with batching, retry and latency timing."""
+
+    def __init__(self, embed_url=EMBED_URL, gen_url=GEN_URL, pool_size=8,
+                 batch_size=32, max_in_flight=4, retries=3, backoff=0.5):
+        self.embed_url = embed_url
+        self.gen_url = gen_url
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight
+
+        retry = Retry(total=retries, backoff_factor=backoff,
+                      status_forcelist=RETRY_STATUS,
+                      allowed_methods=None, raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        # A generation is not idempotent and can run for minutes: only a failed connect is retried,
+        # never a read timeout or 5xx after the prompt reached the model (longest mount prefix wins)
+        gen_retry = Retry(total=retries, connect=retries, read=0, status=0, other=0,
+                          backoff_factor=backoff, allowed_methods=None, raise_on_status=False)
+        self.session.mount(gen_url, HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=gen_retry))
+
+        self._init_timing()
+
+    def post(self, name, url, payload, timeout, stream=False):
+        t0 = time.perf_counter()
+        r = self.session.post(url, json=payload, timeout=timeout, stream=stream)
+        self._record(name, time.perf_counter() - t0)
+        r.raise_for_status()
+        return r
+
+    def _embed_one(self, texts, timeout):
+        r = self.post("embed", self.embed_url, {"chunks": texts}, timeout)
+        return np.array(r.json()["embeddings"], dtype="float32")
+
+    def embed(self, texts, timeout=60):
+        """Embeds texts in batches of `batch_size`, keeping up to `max_in_flight` calls open."""
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        if len(batches) <= 1:
+            return self._embed_one(texts, timeout)
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as pool:
+            parts = list(pool.map(lambda b: self._embed_one(b, timeout), batches))
+        return np.vstack(parts)
+
+    def generate(self, prompt, timeout=300):
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        with self.post("generate", self.gen_url, {"prompt": prompt}, timeout, stream=True) as r:
+            for chunk in r.iter_content(chunk_size=None):
+                if chunk:
+                    yield decoder.decode(chunk)
+
+class AsyncRemoteClient(_Timed):
+    """httpx-based asyncio twin of RemoteClient for event-loop servers."""
+
+    def __init__(self, embed_url=EMBED_URL, gen_url=GEN_URL, pool_size=8,
+                 batch_size=32, max_in_flight=4, retries=3, backoff=0.5):
+        self.embed_url = embed_url
+        self.gen_url = gen_url
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight
+        self.retries = retries
+        self.backoff = backoff
+        limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        self.http = httpx.AsyncClient(transport=httpx.AsyncHTTPTransport(retries=retries, limits=limits))
+        self._init_timing()
+
+    async def post(self, name, url, payload, timeout):
+        for attempt in range(self.retries + 1):
+            t0 = time.perf_counter()
+            r = await self.http.post(url, json=payload, timeout=timeout)
+            self._record(name, time.perf_counter() - t0)
+            if r.status_code not in RETRY_STATUS or attempt == self.retries:
+                break
+            await asyncio.sleep(self.backoff * 2 ** attempt)
+        r.raise_for_status()
+        return r
+
+    async def embed(self, texts, timeout=60):
+        sem = asyncio.Semaphore(self.max_in_flight)
+
+        async def one(batch):
+            async with sem:
+                r = await self.post("embed", self.embed_url, {"chunks": batch}, timeout)
+                return np.array(r.json()["embeddings"], dtype="float32")
+
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)] or [texts]
+        return np.vstack(await asyncio.gather(*(one(b) for b in batches)))
+
+    async def generate(self, prompt, timeout=300):
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        t0 = time.perf_counter()
+        async with self.http.stream("POST", self.gen_url, json={"prompt": prompt}, timeout=timeout) as r:
+            self._record("generate", time.perf_counter() - t0)
+            r.raise_for_status()
+            async for chunk in r.aiter_bytes():
+                if chunk:
+                    yield decoder.decode(chunk)
+
+    async def aclose(self):
+        await self.http.aclose()
+
+_client = None
+_async_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    """Process-wide RemoteClient so every engine/ingestor shares one connection pool."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = RemoteClient()
+        return _client
+
+def get_async_client():
+    """Process-wide AsyncRemoteClient; create and use it from a single event loop."""
+    global _async_client
+    if _async_client is None:
+        _async_client = AsyncRemoteClient()
+    return _async_client
@@ -0,0 +1,173 @@
+import json, os
+import faiss
+import numpy as np
+
+from matryoshka import coarse
+from tracing import tracer
+
+INDEX_KIND = os.environ.get("EDGERAG_INDEX", "flat")
+ENCODING = os.environ.get("EDGERAG_ENCODING", "float")
+ENCODINGS = ("float", "int8", "binary")
+
+DEFAULTS = {
+    "flat":  {},
+    "hnsw":  {"M": 32, "efConstruction": 80, "efSearch": 64},
+    # PQ codes alone rank poorly (recall@15 ~0.27 at m=16); the top k * k_factor are rescored exactly
+    "ivfpq": {"nlist": 256, "m": 32, "nbits": 8, "nprobe": 16, "k_factor": 8},
+}
+
+def params_path(index_path):
+    return index_path + ".params.json"
+
+def _ivfpq_shape(n, dim, params):
+    """Shrinks nlist to what n training vectors support; None means too few to train PQ."""
+    if n < 39 * 2 ** params["nbits"] or dim % params["m"]:
+        return None
+    return min(params["nlist"], max(1, n // 39))
+
+def new_index(kind, dim, params, encoding="float"):
+    """Empty flat or HNSW inner-product index storing float32, int8 or 1-bit codes."""
+    if encoding == "binary":
+        index = faiss.IndexBinaryHNSW(dim, params["M"]) if kind == "hnsw" else faiss.IndexBinaryFlat(dim)
+    elif encoding == "int8":
+        qt = faiss.ScalarQuantizer.QT_8bit
+        index = (faiss.IndexHNSWSQ(dim, qt, params["M"], faiss.METRIC_INNER_PRODUCT) if kind == "hnsw"
+                 else faiss.IndexScalarQuantizer(dim, qt, faiss.METRIC_INNER_PRODUCT))
+    else:
+        index = faiss.IndexHNSWFlat(dim, params["M"], faiss.METRIC_INNER_PRODUCT) if kind == "hnsw" else faiss.IndexFlatIP(dim)
+    if kind == "hnsw":
+        index.hnsw.efConstruction = params["efConstruction"]
+    return index
+
+def unit_range(index):
+    """
+    Fixes an int8 index's quantiser range to [-1, 1] instead of training it on data. L2-normalised
+    embeddings never leave that range, so codes stay valid however few vectors come first.
+    """
+    index = faiss.downcast_index(index)
+    sq_index = faiss.downcast_index(index.storage) if hasattr(index, "storage") else index
+    d = sq_index.d
+    faiss.copy_array_to_vector(np.r_[np.full(d, -1.0), np.full(d, 2.0)].astype("float32"), sq_index.sq.trained)  # vmin, vdiff
+    sq_index.is_trained = index.is_trained = True
+    return index
+
+def encode(vecs, encoding):
+    """Vectors as the index takes them: packed sign bits for binary, float32 otherwise."""
+    x = np.ascontiguousarray(vecs, dtype="float32")
+    return np.packbits(x > 0, axis=1) if encoding == "binary" else x
+
+def needs_rerank(coarse_dim, encoding):
+    """Coarse-prefix and binary indexes only shortlist; full vectors give the final order."""
+    return bool(coarse_dim) or encoding == "binary"
+
+def write_any(index, path):
+    (faiss.write_index_binary if isinstance(index, faiss.IndexBinary) else faiss.write_index)(index, path)
+
+def read_any(path, encoding="float"):
+    return (faiss.read_index_binary if encoding == "binary" else faiss.read_index)(path)
+
+class IndexBuilder:
+    """
+    Builds a flat, HNSW or IVF-PQ inner-product index from vectors added in batches.
+    IVF-PQ and int8 need training data, so their vectors are buffered until finish().
+    IVF-PQ is wrapped in IndexRefineFlat, which keeps the raw vectors and rescores the top
+    k * k_factor PQ candidates exactly.
+    With coarse_dim set, only that Matryoshka prefix of each vector is indexed; with
+    encoding="binary" only its sign bits are. Either way the caller keeps the full
+    vectors for reranking (see needs_rerank).
+    """
+
+    def __init__(self, dim, kind=None, coarse_dim=0, encoding=None, **params):
+        self.full_dim = dim
+        self.coarse_dim = coarse_dim if coarse_dim and coarse_dim < dim else 0
+        dim = self.dim = self.coarse_dim or dim
+        self.kind = kind or INDEX_KIND
+        self.encoding = encoding or ENCODING
+        if self.kind not in DEFAULTS:
+            raise ValueError(f"Unknown index kind '{self.kind}', expected one of {list(DEFAULTS)}")
+        if self.encoding not in ENCODINGS or (self.kind == "ivfpq" and self.encoding != "float"):
+            raise ValueError(f"Encoding '{self.encoding}' is not available for '{self.kind}' indexes")
+        if self.encoding == "binary" and dim % 8:
+            raise ValueError("Binary codes need a dimension that is a multiple of 8")
+        self.params = {**DEFAULTS[self.kind], **params}
+        self.pending = []
+
+        if self.kind == "ivfpq" or self.encoding == "int8":
+            self.index = None
+        else:
+            self.index = new_index(self.kind, dim, self.params, self.encoding)
+
+    @property
+    def rerank(self):
+        return needs_rerank(self.coarse_dim, self.encoding)
+
+    def add(self, vecs):
+        if self.coarse_dim:
+            vecs = coarse(vecs, self.coarse_dim)
+        if self.index is None:
+            self.pending.append(np.asarray(vecs, dtype="float32"))
+        else:
+            with tracer.span("faiss_add", n=len(vecs)):
+                self.index.add(encode(vecs, self.encoding))
+
+    def finish(self):
+        if self.index is None:
+            vecs = np.vstack(self.pending) if self.pending else np.zeros((0, self.dim), dtype="float32")
+            self.pending = []
+            nlist = _ivfpq_shape(len(vecs), self.dim, self.params) if self.kind == "ivfpq" else None
+            if self.kind == "ivfpq" and nlist is None:
+                # Too small to train a quantizer; exact search is cheap at this size anyway
+                self.kind, self.params = "flat", {}
+                self.index = faiss.IndexFlatIP(self.dim)
+            elif self.kind == "ivfpq":
+                self.params["nlist"] = nlist
+                quantizer = faiss.IndexFlatIP(self.dim)
+                ivf = faiss.IndexIVFPQ(quantizer, self.dim, nlist, self.params["m"], self.params["nbits"], faiss.METRIC_INNER_PRODUCT)
+                self.index = faiss.IndexRefineFlat(ivf)
+                apply_search_params(self.index, self.params)
+            else:
+                self.index = new_index(self.kind, self.dim, self.params, self.encoding)
+            if not self.index.is_trained:
+                with tracer.span("faiss_train", n=len(vecs)):
+                    self.index.train(vecs)
+            with tracer.span("faiss_add", n=len(vecs)):
+                self.index.add(vecs)
+        return self.index
+
+    def write(self, index_path):
+        index = self.finish()
+        write_any(index, index_path)
+        with open(params_path(index_path), "w") as f:
+            extra = {"coarse_dim": self.coarse_dim, "dim": self.full_dim} if self.coarse_dim else {}
+            json.dump({"kind": self.kind, "encoding": self.encoding, **self.params, **extra}, f)
+        return index
+
+def apply_search_params(index, params):
+    index = faiss.downcast_IndexBinary(index) if isinstance(index, faiss.IndexBinary) else faiss.downcast_index(index)
+    if "efSearch" in params:
+        index.hnsw.efSearch = params["efSearch"]
+    if "nprobe" in params:
+        faiss.extract_index_ivf(index).nprobe = params["nprobe"]
+    if "k_factor" in params and isinstance(index, faiss.IndexRefine):
+        index.k_factor = params["k_factor"]
+
+def load_params(index_path):
+    if not os.path.exists(params_path(index_path)):
+        return {}
+    with open(params_path(index_path)) as f:
+        return json.load(f)
+
+def load_index(index_path, **overrides):
+    """Reads an index and applies the search-time tunables stored beside it."""
+    params = {**load_params(index_path), **overrides}
+    index = read_any(index_path, params.get("encoding", "float"))
+    apply_search_params(index, params)
+    return index
+
+def replace_index(src, dst):
+    """Moves an index and its params file into place."""
+    os.replace(src, dst)
+    if os.path.exists(params_path(src)):
+        os.replace(params_path(src), params_path(dst))
+    elif os.path.exists(params_path(dst)):
+        os.remove(params_path(dst))
@@ -1,46 +1,65 @@
-import fitz, faiss, json, requests, numpy as np, os
+import fitz, os
 from tqdm import tqdm
 
-EMBED_URL = "https://abhinavdread-bge-en-ft-optimised.hf.space/embed"
+from http_client import get_client
+from embed_cache import get_cache
+from index_factory import IndexBuilder
+from matryoshka import COARSE_DIM
+from chunk_store import write_chunks
+from chunker import CHUNK_TOKENS, Chunker
+from tracing import tracer
+
 EMBED_DIM = 128
 
 class Ingestor:
-    def __init__(self, chunk_size=500, overlap=100):
-        self.chunk_size = chunk_size
-        self.overlap = overlap
-
-    def chunk(self, text):
-        chunks, i = [], 0
-        while i < len(text):
-            chunks.append(text[i:i+self.chunk_size])
-            i += self.chunk_size - self.overlap
-        return chunks
+    def __init__(self, chunk_tokens=CHUNK_TOKENS, client=None, use_cache=True, index_kind=None,
+                 coarse_dim=COARSE_DIM, encoding=None):
+        self.chunk_tokens = chunk_tokens  # estimated, since the embedding tokenizer lives server-side
+        self.index_kind = index_kind
+        self.coarse_dim = coarse_dim
+        self.encoding = encoding  # float32 / int8 / binary codes; None = EDGERAG_ENCODING
+        self.client = client or get_client()
+        self.cache = get_cache(self.client.embed_url, EMBED_DIM) if use_cache else None
 
     def embed(self, texts):
-        r = requests.post(EMBED_URL, json={"chunks": texts}, timeout=120)
-        r.raise_for_status()
-        return np.array(r.json()["embeddings"], dtype="float32")
+        # Bounded batches keep each request well under the timeout on large PDFs
+        def embed_fn(t):
+            with tracer.span("embed_remote", n=len(t)):
+                return self.client.embed(t, timeout=120)
+        if self.cache is None:
+            return embed_fn(texts)
+        vecs = self.cache.embed(texts, embed_fn)
+        self.cache.flush()
+        return vecs
 
-    def ingest(self, pdf_path, index_path, meta_path):
+    def extract(self, pdf_path):
         doc = fitz.open(pdf_path)
+        chunker = Chunker(max_tokens=self.chunk_tokens)
         records = []
 
         for p, page in enumerate(tqdm(doc, desc="Ingesting")):
-            txt = page.get_text().strip()
-            for ch in self.chunk(txt):
-                records.append({
-                    "text": ch,
-                    "meta": {"page": p+1}
-                })
+            with tracer.span("parse", page=p+1):
+                txt = page.get_text().strip()
+            tracer.count("pages")
+            records += chunker.add_page(p+1, txt)
+        records += chunker.finish()
+        tracer.count("chunks", len(records))
 
         doc.close() # Explicitly close to release file lock
+        return records
+
+    def ingest(self, pdf_path, index_path, chunks_path):
+        records = self.extract(pdf_path)
         embeds = self.embed([r["text"] for r in records])
 
-        index = faiss.IndexFlatIP(EMBED_DIM)
-        index.add(embeds)
-        faiss.write_index(index, index_path)
+        builder = IndexBuilder(EMBED_DIM, self.index_kind, coarse_dim=self.coarse_dim, encoding=self.encoding)
+        builder.add(embeds)
+        builder.write(index_path)
 
-        with open(meta_path, "w") as f:
-            json.dump({i: records[i] for i in range(len(records))}, f)
+        return write_chunks(chunks_path, records, embeds if builder.rerank else None)
 
-        return len(records)
+    def ingest_into(self, collection, pdf_path, name=None):
+        """Appends one PDF to a Collection as a new document; returns its doc_id."""
+        records = self.extract(pdf_path)
+        embeds = self.embed([r["text"] for r in records])
+        return collection.add_document(name or os.path.basename(pdf_path), records, embeds)
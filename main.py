@@ -1,38 +1,82 @@
-from flask import Flask, render_template, request, Response, jsonify
-import os, shutil, tempfile
+from flask import Flask, render_template, request, Response, jsonify, g
+import os, tempfile
 
-from ingest_remote import Ingestor
+from ingest_remote import Ingestor, EMBED_DIM
 from engine_remote import RAGEngine
+from collection import Collection
+from scheduler import Admission, QueueFull
+from sessions import SESSION_COOKIE, SESSION_TTL_S, SessionPool, new_session_id, valid_session_id
+from http_client import get_client
+from tracing import tracer
 
 TMP_DIR = tempfile.gettempdir()
-INDEX = os.path.join(TMP_DIR, "faiss.index")
-META  = os.path.join(TMP_DIR, "meta.json")
+SESSIONS_DIR = os.path.join(TMP_DIR, "edgerag_sessions")
+
+MAX_GENERATIONS = int(os.environ.get("EDGERAG_MAX_GENERATIONS", 4))
+MAX_QUEUED = int(os.environ.get("EDGERAG_MAX_QUEUED", 16))
+QUEUE_TIMEOUT_S = 60
 
 app = Flask(__name__)
+# Bounds how many worker threads can be parked on a remote generation stream
+admission = Admission(MAX_GENERATIONS, MAX_QUEUED)
+
+def open_engine(path):
+    return RAGEngine(store=Collection(path, EMBED_DIM))
+
+# Every browser session gets its own collection; warm ones share one memory budget
+sessions = SessionPool(SESSIONS_DIR, open_engine)
+
+def request_session_id(cookies, headers):
+    """The caller's session from its cookie or X-Session-Id header, or None."""
+    sid = cookies.get(SESSION_COOKIE) or headers.get("X-Session-Id")
+    return sid if valid_session_id(sid) else None
 
-def clear_db():
-    for f in [INDEX, META]:
-        if os.path.exists(f):
-            os.remove(f)
+def session_id():
+    """This request's session, starting a new one (sent back as a cookie) if it has none."""
+    sid = request_session_id(request.cookies, request.headers)
+    if sid is None:
+        sid = g.new_session = g.get("new_session") or new_session_id()
+    return sid
+
+@app.after_request
+def set_session_cookie(response):
+    if g.get("new_session"):
+        response.set_cookie(SESSION_COOKIE, g.new_session, max_age=SESSION_TTL_S, httponly=True, samesite="Lax")
+    return response
 
 @app.route("/")
 def home():
-    clear_db()  # auto flush on reload
     return render_template("index.html")
 
 @app.post("/upload")
 def upload():
-    clear_db()
     pdf = request.files["file"]
-    pdf_path = os.path.join(TMP_DIR, "temp.pdf")
+    fd, pdf_path = tempfile.mkstemp(suffix=".pdf", dir=TMP_DIR)
+    os.close(fd)
     pdf.save(pdf_path)
 
-    ing = Ingestor()
-    ing.ingest(pdf_path, INDEX, META)
-
-    if os.path.exists(pdf_path):
+    try:
+        with sessions.writing(session_id()) as store:
+            doc_id = Ingestor().ingest_into(store, pdf_path, pdf.filename)
+    finally:
         os.remove(pdf_path)
-    return {"status": "ok"}
+    return {"status": "ok", "doc_id": doc_id}
+
+@app.get("/documents")
+def documents():
+    engine = sessions.get(session_id())
+    return engine.store.documents() if engine is not None else {}
+
+@app.delete("/documents/<doc_id>")
+def delete_document(doc_id):
+    sid = session_id()
+    if sessions.get(sid) is None:
+        return jsonify({"error": "Unknown document"}), 404
+    with sessions.writing(sid) as store:
+        if doc_id not in store.documents():
+            return jsonify({"error": "Unknown document"}), 404
+        store.delete_document(doc_id)
+    return {"deleted": doc_id}
 
 def stream_static_msg(msg):
     import time
@@ -42,24 +86,56 @@ def stream_static_msg(msg):
 
 @app.post("/ask")
 def ask():
-    if not os.path.exists(INDEX):
+    sid = session_id()
+    engine = sessions.get(sid)
+    if engine is None or not len(engine.store):
         return jsonify({"error": "No document"}), 400
 
     q = request.json["question"]
-    engine = RAGEngine(INDEX, META)
-    chunks = engine.retrieve(q)
+    # Optional: restrict retrieval to some documents of the collection
+    qv, hits = engine.search(q, doc_ids=request.json.get("doc_ids"))
 
-    if not chunks:
+    if not hits:
         return Response(stream_static_msg("I couldn't find relevant information in the uploaded document to answer your question."), mimetype="text/plain")
 
+    ids, version, answers = [h["id"] for h in hits], engine.store.version, sessions.answers(sid)
+    cached = answers.get(version, ids, q, qv)
+    if cached is not None:
+        return Response(iter([cached]), mimetype="text/plain")
+
+    try:
+        slot = admission.acquire(timeout=QUEUE_TIMEOUT_S)
+    except QueueFull:
+        return jsonify({"error": "Server busy", **admission.stats()}), 503
+
     return Response(
-        engine.stream_answer(q, chunks),
+        admission.stream(slot, answers.record(engine.stream_answer(q, hits), version, ids, q, qv)),
         mimetype="text/plain"
     )
 
+@app.get("/queue")
+def queue_stats():
+    return admission.stats()
+
+@app.get("/engine-cache")
+def engine_cache():
+    return sessions.stats()
+
+@app.get("/answer-cache")
+def answer_cache():
+    return sessions.stats()["answer_cache"]
+
+@app.get("/metrics")
+def metrics():
+    return {**tracer.metrics(), "queue": admission.stats(), "sessions": sessions.stats(),
+            "http": get_client().stats()}
+
 @app.post("/clear")
 def clear():
-    clear_db()
+    sid = session_id()
+    if sessions.get(sid) is not None:
+        with sessions.writing(sid) as store:
+            store.clear()
     return {"cleared": True}
 
 if __name__ == "__main__":
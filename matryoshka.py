@@ -0,0 +1,33 @@
+import os
+import numpy as np
+
+# Two-stage search: a COARSE_DIM-prefix index finds CANDIDATES per query, which are
+# rescored with the stored full vectors. 0 keeps single-stage full-dimension search.
+COARSE_DIM = int(os.environ.get("EDGERAG_COARSE_DIM", 0))
+CANDIDATES = int(os.environ.get("EDGERAG_RERANK_CANDIDATES", 100))
+# Hamming distance on sign bits is a much rougher shortlist, so binary indexes take more
+BINARY_CANDIDATES = int(os.environ.get("EDGERAG_BINARY_CANDIDATES", 500))
+
+def shortlist(k, candidates, encoding):
+    return max(k, candidates, BINARY_CANDIDATES if encoding == "binary" else 0)
+
+def coarse(vecs, dim):
+    """Matryoshka prefix of each vector, re-normalised so inner product stays cosine."""
+    x = np.ascontiguousarray(np.asarray(vecs, dtype="float32")[:, :dim])
+    return x / np.maximum(np.linalg.norm(x, axis=1, keepdims=True), 1e-12)
+
+def rerank(qvecs, ids, vectors_for, k):
+    """
+    Rescores candidate `ids` (n_queries x n_candidates, -1 = none) against full
+    vectors from vectors_for(flat_ids) and keeps the top k. Shapes match faiss.
+    """
+    scores = np.full((len(qvecs), k), -np.inf, dtype="float32")
+    out = np.full((len(qvecs), k), -1, dtype="int64")
+    for qi, (q, cand) in enumerate(zip(np.asarray(qvecs, dtype="float32"), ids)):
+        cand = cand[cand != -1]
+        if not len(cand):
+            continue
+        s = vectors_for(cand).astype("float32") @ q
+        top = np.argsort(-s, kind="stable")[:k]
+        scores[qi, :len(top)], out[qi, :len(top)] = s[top], cand[top]
+    return scores, out
@@ -0,0 +1,165 @@
+import asyncio, threading, time
+
+class QueueFull(Exception):
+    pass
+
+class Slot:
+    """One admitted request. release() is idempotent so every exit path may call it."""
+
+    def __init__(self, release):
+        self._release = release
+        self.held = True
+
+    def release(self):
+        if self.held:
+            self.held = False
+            self._release()
+
+class _Guarded:
+    """Iterator that releases its slot when the stream ends, fails, or is closed unstarted."""
+
+    def __init__(self, slot, gen):
+        self.slot = slot
+        self.gen = iter(gen)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self.gen)
+        except BaseException:
+            self.slot.release()
+            raise
+
+    def close(self):
+        try:
+            if hasattr(self.gen, "close"):
+                self.gen.close()
+        finally:
+            self.slot.release()
+
+class _Stats:
+    def _init_stats(self, max_active, max_queue):
+        self.max_active = max_active
+        self.max_queue = max_queue
+        self.active = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.wait_total = 0.0
+
+    def _full(self):
+        return self.active >= self.max_active and self.queued >= self.max_queue
+
+    def _admit(self, t0):
+        self.active += 1
+        self.admitted += 1
+        self.wait_total += time.perf_counter() - t0
+
+    def stats(self):
+        return {"active": self.active, "queued": self.queued, "max_active": self.max_active,
+                "max_queue": self.max_queue, "admitted": self.admitted, "rejected": self.rejected,
+                "mean_wait_ms": 1000 * self.wait_total / self.admitted if self.admitted else 0.0}
+
+class Admission(_Stats):
+    """
+    Thread-based admission control: at most `max_active` generations run, up to
+    `max_queue` more wait for a slot, and anything beyond that raises QueueFull.
+    """
+
+    def __init__(self, max_active=2, max_queue=16):
+        self._init_stats(max_active, max_queue)
+        self.cond = threading.Condition()
+
+    def acquire(self, timeout=None):
+        t0 = time.perf_counter()
+        with self.cond:
+            if self._full():
+                self.rejected += 1
+                raise QueueFull()
+            self.queued += 1
+            try:
+                if not self.cond.wait_for(lambda: self.active < self.max_active, timeout):
+                    self.rejected += 1
+                    raise QueueFull()
+            finally:
+                self.queued -= 1
+            self._admit(t0)
+        return Slot(self._release)
+
+    def _release(self):
+        with self.cond:
+            self.active -= 1
+            self.cond.notify()
+
+    def stream(self, slot, gen):
+        return _Guarded(slot, gen)
+
+class AsyncAdmission(_Stats):
+    """asyncio counterpart of Admission for event-loop servers."""
+
+    def __init__(self, max_active=2, max_queue=16):
+        self._init_stats(max_active, max_queue)
+        self.sem = asyncio.Semaphore(max_active)
+
+    async def acquire(self, timeout=None):
+        if self._full():
+            self.rejected += 1
+            raise QueueFull()
+        t0 = time.perf_counter()
+        self.queued += 1
+        try:
+            await asyncio.wait_for(self.sem.acquire(), timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise QueueFull()
+        finally:
+            self.queued -= 1
+        self._admit(t0)
+        return Slot(self._release)
+
+    def _release(self):
+        self.active -= 1
+        self.sem.release()
+
+    async def stream(self, slot, agen):
+        try:
+            async for item in agen:
+                yield item
+        finally:
+            slot.release()
+
+_END = object()
+
+async def iterate_in_executor(executor, make_iter):
+    """
+    Drives a blocking iterator (e.g. a llama.cpp token stream) on `executor` and
+    yields its items on the event loop. Closing the async generator stops the producer.
+    """
+    loop = asyncio.get_running_loop()
+    q = asyncio.Queue()
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for item in make_iter():
+                if stop.is_set():
+                    break
+                loop.call_soon_threadsafe(q.put_nowait, (item, None))
+        except BaseException as e:
+            loop.call_soon_threadsafe(q.put_nowait, (_END, e))
+        else:
+            loop.call_soon_threadsafe(q.put_nowait, (_END, None))
+
+    loop.run_in_executor(executor, produce)
+    try:
+        while True:
+            item, err = await q.get()
+            if item is _END:
+                if err is not None:
+                    raise err
+                break
+            yield item
+    finally:
+        stop.set()
@@ -0,0 +1,143 @@
+import os, re, shutil, threading, time, uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from answer_cache import AnswerCache
+
+SESSION_COOKIE = "edgerag_session"
+# Warm indexes across all sessions; idle ones beyond this are dropped and reload from disk on demand
+MEMORY_BUDGET = int(os.environ.get("EDGERAG_SESSION_MEMORY_MB", 512)) << 20
+SESSION_TTL_S = int(os.environ.get("EDGERAG_SESSION_TTL_S", 7 * 24 * 3600))
+ENGINE_OVERHEAD = 1 << 20  # per warm engine, besides its index
+_SESSION_ID = re.compile(r"[0-9a-f]{32}")
+
+def file_identity(*paths):
+    """(path, mtime_ns, size) for each file; changes whenever a file is rewritten."""
+    ident = []
+    for p in paths:
+        st = os.stat(p)
+        ident.append((os.path.abspath(p), st.st_mtime_ns, st.st_size))
+    return tuple(ident)
+
+def new_session_id():
+    return uuid.uuid4().hex
+
+def valid_session_id(sid):
+    """Session IDs name directories, so anything but our own hex IDs is rejected."""
+    return isinstance(sid, str) and _SESSION_ID.fullmatch(sid) is not None
+
+class SessionPool:
+    """
+    One Collection per session under <root>/<session_id>/, opened through `factory(path)`
+    (an engine with a .store). Warm engines are kept in LRU order within `memory_budget`
+    bytes, estimated from their index files; an evicted session stays on disk and reloads
+    on its next request. Writes to one session are serialised by its own lock, and each
+    warm session has its own AnswerCache. Sessions untouched for `ttl` seconds are deleted.
+    """
+
+    def __init__(self, root, factory, memory_budget=MEMORY_BUDGET, ttl=SESSION_TTL_S, answers_per_session=64):
+        self.root = root
+        self.factory = factory
+        self.memory_budget = memory_budget
+        self.ttl = ttl
+        self.answers_per_session = answers_per_session
+        self.lock = threading.RLock()
+        self.warm = OrderedDict()  # sid -> [manifest identity, engine, bytes]
+        self.answer_caches = {}
+        self.write_locks = {}
+        self.hits = 0
+        self.loads = 0
+        self.evictions = 0
+        self.last_sweep = 0.0
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, sid):
+        if not valid_session_id(sid):
+            raise ValueError("Invalid session id")
+        return os.path.join(self.root, sid)
+
+    def exists(self, sid):
+        return valid_session_id(sid) and os.path.exists(os.path.join(self.root, sid, "manifest.json"))
+
+    def get(self, sid, create=False):
+        """The session's warm engine (loading it if needed), or None for an unknown session."""
+        if not create and not self.exists(sid):
+            return None
+        path = self.path(sid)
+        with self.lock:
+            entry = self.warm.get(sid)
+            if entry is not None and entry[0] == self._identity(path):
+                self.hits += 1
+                self.warm.move_to_end(sid)
+                return entry[1]
+            # New, evicted, or rewritten by another worker process
+            engine = self.factory(path)
+            os.utime(path)  # the directory mtime marks last use for sweep()
+            self.loads += 1
+            self.warm[sid] = [self._identity(path), engine, self._bytes(path)]
+            self.warm.move_to_end(sid)
+            self._evict()
+            return engine
+
+    def answers(self, sid):
+        with self.lock:
+            if sid not in self.answer_caches:
+                self.answer_caches[sid] = AnswerCache(max_entries=self.answers_per_session)
+            return self.answer_caches[sid]
+
+    @contextmanager
+    def writing(self, sid):
+        """Yields the session's store under its write lock; the warm engine is kept afterwards."""
+        with self.lock:
+            lock = self.write_locks.setdefault(sid, threading.Lock())
+        with lock:
+            engine = self.get(sid, create=True)
+            yield engine.store
+            path = self.path(sid)
+            with self.lock:
+                if sid in self.warm and self.warm[sid][1] is engine:
+                    self.warm[sid][0], self.warm[sid][2] = self._identity(path), self._bytes(path)
+                    self._evict()
+        self.sweep()
+
+    def _identity(self, path):
+        manifest = os.path.join(path, "manifest.json")
+        return file_identity(manifest) if os.path.exists(manifest) else None
+
+    def _bytes(self, path):
+        index = os.path.join(path, "index.faiss")
+        return ENGINE_OVERHEAD + (os.path.getsize(index) if os.path.exists(index) else 0)
+
+    def _evict(self):
+        # The most recently used session always stays, even if it alone exceeds the budget.
+        # Requests still holding an evicted engine keep using it until they finish.
+        while len(self.warm) > 1 and sum(e[2] for e in self.warm.values()) > self.memory_budget:
+            sid, _ = self.warm.popitem(last=False)
+            self.answer_caches.pop(sid, None)
+            os.utime(self.path(sid))
+            self.evictions += 1
+
+    def sweep(self, interval=3600):
+        """Deletes cold sessions unused for ttl seconds; runs at most once per interval."""
+        now = time.time()
+        if not self.ttl or now - self.last_sweep < interval:
+            return
+        self.last_sweep = now
+        for sid in os.listdir(self.root):
+            try:
+                idle = now - os.path.getmtime(os.path.join(self.root, sid))
+            except OSError:
+                continue
+            with self.lock:
+                if idle < self.ttl or sid in self.warm or self.write_locks.get(sid, threading.Lock()).locked():
+                    continue
+                self.write_locks.pop(sid, None)
+                shutil.rmtree(os.path.join(self.root, sid), ignore_errors=True)
+
+    def stats(self):
+        with self.lock:
+            answer_stats = [c.stats() for c in self.answer_caches.values()]
+            return {"warm": len(self.warm), "bytes": sum(e[2] for e in self.warm.values()),
+                    "memory_budget": self.memory_budget, "hits": self.hits, "loads": self.loads,
+                    "evictions": self.evictions,
+                    "answer_cache": {k: sum(s[k] for s in answer_stats) for k in ("entries", "hits", "near_hits", "misses")}}
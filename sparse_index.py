@@ -0,0 +1,126 @@
+import hashlib, os, re
+from collections import Counter
+from functools import lru_cache
+
+import numpy as np
+
+TOKEN_RE = re.compile(r"\w+")
+STOPWORDS = frozenset("""a an and are as at be by can do does for from has have how in is it its of on or
+that the their this to was were what when where which who why will with""".split())
+
+# Fuse BM25 with dense retrieval unless EDGERAG_HYBRID=0
+HYBRID = os.environ.get("EDGERAG_HYBRID", "1") != "0"
+
+FILES = ("terms.npy", "indptr.npy", "postings.npy", "tf.npy", "doclen.npy")
+
+@lru_cache(maxsize=1 << 16)
+def term_hash(term):
+    return int.from_bytes(hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest(), "little")
+
+def tokenize(text):
+    """Lower-cased word tokens minus stopwords; acronyms, equation and table numbers survive intact."""
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+class SparseIndexWriter:
+    """
+    Builds a BM25 inverted index for the chunks of one store. Terms are 64-bit hashes,
+    so there is no vocabulary file; postings are CSR arrays:
+      terms.npy     sorted uint64 term hashes
+      indptr.npy    int64, postings of terms[i] are postings[indptr[i]:indptr[i+1]]
+      postings.npy  int32 chunk positions
+      tf.npy        uint16 term frequencies
+      doclen.npy    int32 tokens per chunk
+    """
+
+    def __init__(self):
+        self.hashes, self.chunks, self.tfs, self.doclen = [], [], [], []
+
+    def add(self, text):
+        counts = Counter(tokenize(text))
+        pos = len(self.doclen)
+        self.doclen.append(sum(counts.values()))
+        for term, tf in counts.items():
+            self.hashes.append(term_hash(term))
+            self.chunks.append(pos)
+            self.tfs.append(tf)
+
+    def write(self, path):
+        hashes = np.array(self.hashes, dtype=np.uint64)
+        chunks = np.array(self.chunks, dtype=np.int32)
+        order = np.lexsort((chunks, hashes))
+        hashes, chunks = hashes[order], chunks[order]
+        terms, starts = np.unique(hashes, return_index=True)
+        np.save(os.path.join(path, "terms.npy"), terms)
+        np.save(os.path.join(path, "indptr.npy"), np.append(starts, len(hashes)).astype(np.int64))
+        np.save(os.path.join(path, "postings.npy"), chunks)
+        np.save(os.path.join(path, "tf.npy"), np.minimum(np.array(self.tfs, dtype=np.int64)[order], 65535).astype(np.uint16))
+        np.save(os.path.join(path, "doclen.npy"), np.array(self.doclen, dtype=np.int32))
+
+class SparseIndex:
+    """Memory-mapped reader for a SparseIndexWriter directory."""
+
+    def __init__(self, path):
+        load = lambda name: np.load(os.path.join(path, name), mmap_mode="r")
+        self.terms, self.indptr, self.postings, self.tf, self.doclen = (load(f) for f in FILES)
+        self.total_len = int(self.doclen.sum())
+
+    @staticmethod
+    def exists(path):
+        return all(os.path.exists(os.path.join(path, f)) for f in FILES)
+
+    def __len__(self):
+        return len(self.doclen)
+
+    def lookup(self, h):
+        """(positions, tf) of the chunks containing term hash `h`."""
+        i = int(np.searchsorted(self.terms, h))
+        if i == len(self.terms) or self.terms[i] != h:
+            return None
+        lo, hi = self.indptr[i], self.indptr[i + 1]
+        return self.postings[lo:hi], self.tf[lo:hi]
+
+def bm25_search(parts, query, k, k1=1.2, b=0.75):
+    """
+    BM25 top-k over several indexes scored as one corpus. `parts` is a list of
+    (SparseIndex, id_offset); returned IDs are position + offset. Shapes match faiss.
+    """
+    empty = np.zeros((1, 0), dtype="float32"), np.zeros((1, 0), dtype="int64")
+    hashes = [np.uint64(term_hash(t)) for t in set(tokenize(query))]
+    n_docs = sum(len(p) for p, _ in parts)
+    if not hashes or not n_docs:
+        return empty
+    avgdl = max(sum(p.total_len for p, _ in parts) / n_docs, 1.0)
+
+    hits = {h: [(p, off, p.lookup(h)) for p, off in parts] for h in hashes}
+    ids, contrib = [], []
+    for h, found in hits.items():
+        found = [(p, off, r) for p, off, r in found if r is not None]
+        df = sum(len(r[0]) for _, _, r in found)
+        if not df:
+            continue
+        idf = np.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+        for p, off, (pos, tf) in found:
+            tf = tf.astype("float32")
+            norm = k1 * (1 - b + b * p.doclen[pos] / avgdl)
+            ids.append(pos.astype("int64") + off)
+            contrib.append(idf * tf * (k1 + 1) / (tf + norm))
+    if not ids:
+        return empty
+
+    uniq, inv = np.unique(np.concatenate(ids), return_inverse=True)
+    scores = np.bincount(inv, weights=np.concatenate(contrib)).astype("float32")
+    top = np.argpartition(-scores, min(k, len(scores)) - 1)[:k]
+    top = top[np.argsort(-scores[top])]
+    return scores[top][None], uniq[top][None]
+
+def rrf(rankings, k, c=60):
+    """Reciprocal rank fusion of ranked ID lists; returns (ids, scores) best first."""
+    rankings = [np.asarray(r, dtype="int64") for r in rankings if len(r)]
+    if not rankings:
+        return np.zeros(0, dtype="int64"), np.zeros(0, dtype="float32")
+    ids = np.concatenate(rankings)
+    weights = np.concatenate([1.0 / (c + 1 + np.arange(len(r))) for r in rankings])
+    uniq, inv = np.unique(ids, return_inverse=True)
+    scores = np.bincount(inv, weights=weights)
+    order = np.argsort(-scores, kind="stable")[:k]
+    return uniq[order], scores[order].astype("float32")
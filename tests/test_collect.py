@@ -0,0 +1,90 @@
+import http.server, json, os, sys, threading
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Embedding_data_gen"))
+from collect import collect
+
+PAPERS = {"p1": os.urandom(300_000), "p2": os.urandom(200_000), "p3": os.urandom(100_000)}
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    """Serves PAPERS by path, honouring "Range: bytes=N-" unless the server ignores ranges."""
+
+    def do_GET(self):
+        name = self.path.strip("/")
+        body = PAPERS[name]
+        self.server.log.append((name, self.headers.get("Range")))
+        start = 0
+        if self.headers.get("Range") and not self.server.ignore_range:
+            start = int(self.headers["Range"].split("=")[1].rstrip("-"))
+            if start >= len(body):
+                self.send_response(416)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(body) - 1}/{len(body)}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(body) - start))
+        self.end_headers()
+        self.wfile.write(body[start:])
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def server():
+    srv = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    srv.log, srv.ignore_range = [], False
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    yield srv
+    srv.shutdown()
+
+def papers(server, ids):
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    return [{"id": i, "url": f"{base}/{i}", "title": "Same Title"} for i in ids]
+
+def manifest(out_dir):
+    with open(os.path.join(out_dir, "manifest.jsonl")) as f:
+        return {e["id"]: e for e in map(json.loads, f)}
+
+def test_downloads_by_id_and_counts_duplicates_once(server, tmp_path):
+    out = str(tmp_path)
+    assert collect(papers(server, ["p1", "p2", "p1"]), out, 3, workers=2, rate_per_host=0) == (2, 0)
+    for pid in ("p1", "p2"):
+        with open(os.path.join(out, f"{pid}.pdf"), "rb") as f:
+            assert f.read() == PAPERS[pid]
+        assert manifest(out)[pid]["size"] == len(PAPERS[pid])
+    assert sorted(name for name, _ in server.log) == ["p1", "p2"]
+
+def test_manifest_skips_completed_papers(server, tmp_path):
+    out = str(tmp_path)
+    collect(papers(server, ["p1", "p2"]), out, 2, rate_per_host=0)
+    server.log.clear()
+    assert collect(papers(server, ["p1", "p2", "p3"]), out, 3, rate_per_host=0) == (3, 0)
+    assert server.log == [("p3", None)]
+
+def test_resumes_partial_file_with_range(server, tmp_path):
+    out = str(tmp_path)
+    with open(os.path.join(out, "p3.pdf.part"), "wb") as f:
+        f.write(PAPERS["p3"][:40_000])
+    assert collect(papers(server, ["p3"]), out, 1, rate_per_host=0) == (1, 0)
+    assert server.log == [("p3", "bytes=40000-")]
+    with open(os.path.join(out, "p3.pdf"), "rb") as f:
+        assert f.read() == PAPERS["p3"]
+
+def test_complete_part_file_and_server_without_range(server, tmp_path):
+    out = str(tmp_path)
+    with open(os.path.join(out, "p2.pdf.part"), "wb") as f:
+        f.write(PAPERS["p2"])  # crashed after the last byte, before the rename
+    with open(os.path.join(out, "p3.pdf.part"), "wb") as f:
+        f.write(b"stale")
+    server.ignore_range = True
+    assert collect(papers(server, ["p3"]), out, 1, rate_per_host=0) == (1, 0)
+    assert server.log == [("p3", "bytes=5-")]  # answered 200: the stale part is overwritten
+    server.ignore_range = False
+    assert collect(papers(server, ["p2"]), out, 1, rate_per_host=0) == (1, 0)  # 416: already complete
+    for pid in ("p2", "p3"):
+        with open(os.path.join(out, f"{pid}.pdf"), "rb") as f:
+            assert f.read() == PAPERS[pid]
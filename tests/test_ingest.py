@@ -0,0 +1,86 @@
+import os, sys, threading
+
+import numpy as np
+import pytest
+
+fitz = pytest.importorskip("fitz")
+pytest.importorskip("onnxruntime")
+pytest.importorskip("pytesseract")
+pytest.importorskip("PIL")
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Local_run"))
+import ingest
+from chunker import approx_tokens
+from collection import Collection
+
+DIM = 8
+
+class _Embedder:
+    """Deterministic vectors; raises on the call numbered `fail_at`."""
+    model_id = "test"
+
+    def __init__(self, fail_at=None):
+        self.fail_at, self.calls = fail_at, 0
+
+    def count_tokens(self, texts):
+        return approx_tokens(texts)
+
+    def encode(self, texts, dim, token_budget, max_batch):
+        self.calls += 1
+        if self.calls == self.fail_at:
+            raise RuntimeError("embed failed")
+        return np.ones((len(texts), dim), dtype="float32") / np.sqrt(dim)
+
+def _pdf(path, pages=40):
+    doc = fitz.open()
+    for p in range(pages):
+        text = " ".join(f"Sentence {s} of section {p} describes result {p * s}." for s in range(12))
+        doc.new_page().insert_textbox(fitz.Rect(72, 72, 520, 770), text)
+    doc.save(path)
+    doc.close()
+
+def _ingestor(monkeypatch, embedder):
+    monkeypatch.setattr(ingest, "get_embedder", lambda model_dir: embedder)
+    return ingest.Ingestor(None, embed_dim=DIM, chunk_tokens=16, ocr_workers=1, queue_size=2,
+                           stream_batch=2, use_cache=False, ocr_cache=False)
+
+def _run(target, *args):
+    """Runs target in a thread; returns (finished, exception) after a bounded wait."""
+    out = {}
+    def go():
+        try:
+            out["result"] = target(*args)
+        except BaseException as e:
+            out["error"] = e
+    t = threading.Thread(target=go, daemon=True)
+    t.start()
+    t.join(timeout=30)
+    return not t.is_alive(), out
+
+def test_ingest_commits_document(tmp_path, monkeypatch):
+    pdf = str(tmp_path / "paper.pdf")
+    _pdf(pdf)
+    collection = Collection(str(tmp_path / "collection"), DIM, coarse_dim=0)
+    ingestor = _ingestor(monkeypatch, _Embedder())
+    try:
+        finished, out = _run(ingestor.ingest_into, collection, pdf)
+    finally:
+        ingestor.close()
+    assert finished and "error" not in out
+    assert out["result"] in collection.documents()
+
+def test_embed_failure_stops_stages_and_removes_tmp_store(tmp_path, monkeypatch):
+    pdf = str(tmp_path / "paper.pdf")
+    _pdf(pdf)
+    collection = Collection(str(tmp_path / "collection"), DIM, coarse_dim=0)
+    ingestor = _ingestor(monkeypatch, _Embedder(fail_at=2))
+    try:
+        finished, out = _run(ingestor.ingest_into, collection, pdf)
+    finally:
+        ingestor.close()
+    assert finished, "ingest hung after the embed stage failed"
+    assert isinstance(out.get("error"), RuntimeError)
+    assert not [t for t in threading.enumerate() if isinstance(t, ingest._Stage)]
+    docs = tmp_path / "collection" / "docs"
+    assert not docs.exists() or not list(docs.iterdir())
+    assert not len(collection)
@@ -0,0 +1,108 @@
+import json, os, threading, time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+import numpy as np
+
+TRACE_FILE = os.environ.get("EDGERAG_TRACE_FILE")
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open-ended
+BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+class Tracer:
+    """
+    Per-stage latency histograms, counters and sampled values for one process.
+    Every observation can also be appended to a JSONL trace file for offline analysis.
+    """
+
+    def __init__(self, trace_path=TRACE_FILE, window=2048):
+        self.lock = threading.Lock()
+        self.window = window
+        self.trace = open(trace_path, "a", buffering=1) if trace_path else None
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.hist = defaultdict(lambda: np.zeros(len(BUCKETS_MS) + 1, dtype="int64"))
+            self.total = defaultdict(float)
+            self.recent = defaultdict(lambda: deque(maxlen=self.window))
+            self.counters = defaultdict(int)
+            self.values = defaultdict(lambda: deque(maxlen=self.window))
+
+    def _write(self, kind, name, x, attrs):
+        if self.trace is not None:
+            self.trace.write(json.dumps({"ts": time.time(), "kind": kind, "name": name, "value": x, **attrs}) + "\n")
+
+    def observe(self, stage, seconds, **attrs):
+        ms = seconds * 1000
+        with self.lock:
+            self.hist[stage][np.searchsorted(BUCKETS_MS, ms)] += 1
+            self.total[stage] += ms
+            self.recent[stage].append(ms)
+            self._write("stage", stage, ms, attrs)
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] += n
+
+    def value(self, name, x, **attrs):
+        """Non-latency samples such as tokens/s."""
+        with self.lock:
+            self.values[name].append(x)
+            self._write("value", name, x, attrs)
+
+    @contextmanager
+    def span(self, stage, **attrs):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - t0, **attrs)
+
+    def _finish_stream(self, stage, t0, first, n):
+        end = time.perf_counter()
+        self.observe(stage, end - t0, tokens=n)
+        self.count(stage + "_tokens", n)
+        if first is not None and n > 1 and end > first:
+            self.value(stage + "_tokens_per_s", (n - 1) / (end - first))
+
+    def stream(self, gen, stage="generate"):
+        """Passes a token stream through, recording time to first token and tokens/s."""
+        t0, first, n = time.perf_counter(), None, 0
+        try:
+            for token in gen:
+                if first is None:
+                    first = time.perf_counter()
+                    self.observe(stage + "_ttft", first - t0)
+                n += 1
+                yield token
+        finally:
+            self._finish_stream(stage, t0, first, n)
+
+    async def astream(self, agen, stage="generate"):
+        t0, first, n = time.perf_counter(), None, 0
+        try:
+            async for token in agen:
+                if first is None:
+                    first = time.perf_counter()
+                    self.observe(stage + "_ttft", first - t0)
+                n += 1
+                yield token
+        finally:
+            self._finish_stream(stage, t0, first, n)
+
+    def metrics(self):
+        with self.lock:
+            stages = {}
+            for stage, counts in self.hist.items():
+                recent = np.array(self.recent[stage])
+                stages[stage] = {"count": int(counts.sum()), "mean_ms": self.total[stage] / counts.sum(),
+                                 "p50_ms": float(np.percentile(recent, 50)),
+                                 "p95_ms": float(np.percentile(recent, 95)),
+                                 "buckets_ms": {str(b): int(c) for b, c in zip(BUCKETS_MS + ("inf",), counts)}}
+            values = {name: {"count": len(xs), "mean": float(np.mean(xs)), "p50": float(np.percentile(xs, 50))}
+                      for name, xs in self.values.items() if xs}
+            return {"stages": stages, "counters": dict(self.counters), "values": values}
+
+# Process-wide tracer shared by the ingest, retrieval and generation paths
+tracer = Tracer()